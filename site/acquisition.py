@@ -0,0 +1,96 @@
+# acquisition.py
+# Background sampling loop: reads the sensor at settings["update_speed"]
+# and keeps the newest value in memory, so HTTP handlers never sample.
+import threading
+import time
+from datetime import datetime
+
+from fake_co2 import generate_co2, save_reading
+
+# co2_readings keeps one reading per sensor and epoch second: faster
+# sampling would reach the dashboards but not the history
+MIN_UPDATE_SPEED = 1
+
+
+class AcquisitionEngine:
+    def __init__(self, load_settings, read_sensor=generate_co2, store=save_reading):
+        self.load_settings = load_settings
+        self.read_sensor = read_sensor
+        self.store = store
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # replaced as a whole on every tick, readers never see a half update
+        self._latest = {"analysis_running": False, "ppm": None, "timestamp": None}
+
+        # called with the new snapshot on every sample or pause/resume
+        self._listeners = []
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="co2-acquisition", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def refresh(self):
+        # settings changed: re-read them now instead of after the current sleep
+        self._wake.set()
+
+    def latest(self):
+        return self._latest
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def _publish(self, latest):
+        self._latest = latest
+        for fn in self._listeners:
+            try:
+                fn(latest)
+            except Exception as e:
+                print(f"[acquisition] listener failed: {e}")
+
+    def _sample(self, settings):
+        ppm = self.read_sensor(settings["realistic_mode"])
+        self.store(ppm)
+
+        self._publish({
+            "analysis_running": True,
+            "ppm": ppm,
+            "timestamp": datetime.utcnow().isoformat(),
+        })
+
+    def _run(self):
+        next_due = 0.0
+
+        while not self._stop.is_set():
+            delay = 1.0
+            try:
+                settings = self.load_settings()
+                delay = max(MIN_UPDATE_SPEED, float(settings.get("update_speed") or 1))
+
+                if not settings["analysis_running"]:
+                    if self._latest["analysis_running"]:
+                        self._publish({"analysis_running": False, "ppm": None, "timestamp": None})
+                elif time.monotonic() >= next_due or not self._latest["analysis_running"]:
+                    self._sample(settings)
+                    next_due = time.monotonic() + delay
+            except Exception as e:
+                print(f"[acquisition] sample failed: {e}")
+                next_due = time.monotonic() + delay
+
+            # a refresh() only re-reads settings, it does not force a sample
+            self._wake.wait(max(0.0, next_due - time.monotonic()) or delay)
+            self._wake.clear()
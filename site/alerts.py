@@ -0,0 +1,151 @@
+# alerts.py
+# Server-side threshold alerts. Every stored reading is evaluated once,
+# inside the ingest transaction that writes it, whatever the number of
+# open dashboards. A level change needs the reading to fall clearly back
+# under a threshold (hysteresis) and to hold for a while (debounce)
+# before it is recorded in alert_events and pushed to subscribers.
+import os
+import threading
+
+from config import thresholds
+from database import get_db
+
+HYSTERESIS_PPM = int(os.environ.get("AERIUM_ALERT_HYSTERESIS_PPM", "50"))
+DEBOUNCE_S = int(os.environ.get("AERIUM_ALERT_DEBOUNCE_S", "15"))
+
+# index = severity
+LEVELS = ("good", "medium", "bad", "alert")
+
+MAX_EVENTS = 1000
+
+STATE_SQL = """
+    INSERT INTO alert_state (sensor_id, level, candidate, since, last_ts)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (sensor_id) DO UPDATE
+    SET level = excluded.level, candidate = excluded.candidate,
+        since = excluded.since, last_ts = excluded.last_ts
+"""
+
+
+def classify(ppm, thresholds):
+    # thresholds: (good, bad, alert), the lower bound of levels 1..3
+    level = 0
+    for bound in thresholds:
+        if ppm >= bound:
+            level += 1
+    return level
+
+
+def target_level(ppm, current, thresholds, hysteresis=HYSTERESIS_PPM):
+    """Level a reading points to: up as soon as a threshold is reached,
+    down only once it is `hysteresis` ppm below it."""
+    level = classify(ppm, thresholds)
+    if level >= current:
+        return level
+    return min(current, classify(ppm + hysteresis, thresholds))
+
+
+class AlertEngine:
+    """Per-sensor level state machines, persisted in alert_state so
+    evaluation survives restarts and is shared by serve.py processes."""
+
+    def __init__(self, load_settings, hysteresis=HYSTERESIS_PPM, debounce=DEBOUNCE_S):
+        self.load_settings = load_settings
+        self.hysteresis = hysteresis
+        self.debounce = debounce
+        self._written = False
+        self._cursor = None  # newest event id already handed out by poll()
+        self._lock = threading.Lock()
+
+    def thresholds(self):
+        # increasing order, as classify() needs
+        return thresholds(self.load_settings())
+
+    def apply(self, db, rows):
+        """Ingest hook: evaluate a batch of (sensor_id, ts, ppm) rows."""
+        thresholds = self.thresholds()
+        by_sensor = {}
+        for sensor_id, ts, ppm in rows:
+            by_sensor.setdefault(sensor_id, []).append((ts, ppm))
+
+        for sensor_id, readings in by_sensor.items():
+            row = db.execute("""
+                SELECT level, candidate, since, last_ts FROM alert_state WHERE sensor_id = ?
+            """, (sensor_id,)).fetchone()
+            level, candidate, since, last_ts = row if row else (0, None, None, None)
+
+            for ts, ppm in sorted(readings):
+                # late readings (a node catching up) do not rewind the state
+                if last_ts is not None and ts <= last_ts:
+                    continue
+                last_ts = ts
+
+                target = target_level(ppm, level, thresholds, self.hysteresis)
+                if target == level:
+                    candidate = since = None
+                    continue
+                if target != candidate:
+                    candidate, since = target, ts
+                if ts - since < self.debounce:
+                    continue
+
+                db.execute("""
+                    INSERT INTO alert_events (sensor_id, ts, level, previous, ppm)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (sensor_id, ts, LEVELS[target], LEVELS[level], ppm))
+                self._written = True
+                level, candidate, since = target, None, None
+
+            if last_ts is not None:
+                db.execute(STATE_SQL, (sensor_id, level, candidate, since, last_ts))
+
+    def take_written(self):
+        # True if a batch recorded events since the last call
+        written, self._written = self._written, False
+        return written
+
+    def poll(self):
+        """Committed events not handed out yet by this process, oldest
+        first. Reading them back (rather than keeping what apply() saw)
+        means a rolled-back batch never announces anything."""
+        with self._lock:
+            if self._cursor is None:
+                self._cursor = last_event_id()
+                return []
+            events = fetch_events(after_id=self._cursor, limit=MAX_EVENTS)
+            if events:
+                self._cursor = events[-1]["id"]
+        return events
+
+
+def fetch_events(sensor_id=None, start=None, end=None, after_id=None, limit=100):
+    """Newest first; after_id returns only newer events (oldest first)."""
+    where, params = [], []
+    if sensor_id is not None:
+        where.append("sensor_id = ?")
+        params.append(sensor_id)
+    if start is not None:
+        where.append("ts >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("ts < ?")
+        params.append(end)
+    if after_id is not None:
+        where.append("id > ?")
+        params.append(after_id)
+
+    order = "id" if after_id is not None else "ts DESC, id DESC"
+    sql = "SELECT id, sensor_id, ts, datetime(ts, 'unixepoch') AS timestamp, level, previous, ppm FROM alert_events"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order} LIMIT ?"
+    params.append(min(limit, MAX_EVENTS))
+
+    with get_db() as db:
+        rows = db.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+
+def last_event_id():
+    with get_db() as db:
+        return db.execute("SELECT COALESCE(MAX(id), 0) FROM alert_events").fetchone()[0]
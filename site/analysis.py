@@ -0,0 +1,215 @@
+# analysis.py
+# Range analytics on NumPy arrays: a range is loaded in one fetch into
+# contiguous ts / ppm arrays, then summary statistics, percentiles,
+# histograms, time-weighted exposure and daily profiles are vectorized.
+# Used by /api/stats and the PDF reports.
+import itertools
+
+import numpy as np
+
+import rollups
+from config import thresholds
+from database import DEFAULT_SENSOR, get_db
+from rolling import MAX_GAP_S
+
+PERCENTILES = (50, 90, 95, 99)
+BANDS = ("good", "medium", "bad")
+
+# ts and ppm travel packed in one integer column ((ts - start) << 16 | ppm):
+# one value per row instead of a tuple is what makes the fetch fast.
+# ppm is validated well below 2^16 on ingest.
+PPM_BITS = 16
+PPM_MASK = (1 << PPM_BITS) - 1
+
+
+class Series:
+    """Readings of one sensor in [start, end), oldest first."""
+
+    def __init__(self, start, end, ts, ppm):
+        self.start = start
+        self.end = end
+        self.ts = ts
+        self.ppm = ppm
+
+    def __len__(self):
+        return len(self.ts)
+
+
+def load(start, end, sensor_id=DEFAULT_SENSOR):
+    with get_db() as db:
+        # plain tuples: building sqlite3.Row objects would double the fetch time
+        cur = db.cursor()
+        cur.row_factory = None
+        cur.execute(f"""
+            SELECT ((ts - ?) << {PPM_BITS}) | ppm
+            FROM co2_readings
+            WHERE sensor_id = ? AND ts >= ? AND ts < ?
+            ORDER BY ts
+        """, (start, sensor_id, start, end))
+        packed = np.fromiter(itertools.chain.from_iterable(cur), dtype=np.int64)
+
+    ts = (packed >> PPM_BITS) + start
+    ppm = (packed & PPM_MASK).astype(np.int32)
+    return Series(start, end, ts, ppm)
+
+
+class SeriesKind:
+    """range_cache kind for a sensor's raw readings as NumPy arrays."""
+
+    step = 1
+
+    def load(self, sensor_id, start, end):
+        return load(start, end, sensor_id)
+
+    def slice(self, series, lo, hi):
+        i, j = np.searchsorted(series.ts, [lo, hi])
+        return Series(lo, hi, series.ts[i:j], series.ppm[i:j])
+
+    def concat(self, a, b):
+        if not len(b):
+            return a
+        return Series(a.start, b.end, np.concatenate([a.ts, b.ts]), np.concatenate([a.ppm, b.ppm]))
+
+    def nbytes(self, series):
+        return series.ts.nbytes + series.ppm.nbytes
+
+
+SERIES = SeriesKind()
+
+
+def durations(series):
+    """Seconds each reading stands for: until the next one (or the end of
+    the range), capped at MAX_GAP_S so sensor outages do not count."""
+    if not len(series):
+        return np.zeros(0, dtype=np.int64)
+    following = np.append(series.ts[1:], series.end)
+    return np.clip(following - series.ts, 0, MAX_GAP_S)
+
+
+def bands(ppm, good_threshold, bad_threshold):
+    # 0 = good, 1 = medium, 2 = bad
+    return np.searchsorted([good_threshold, bad_threshold], ppm, side="right")
+
+
+def summary(series, good_threshold, bad_threshold):
+    n = len(series)
+    result = {
+        "count": n,
+        "avg": None,
+        "min": None,
+        "max": None,
+        "percentiles": {f"p{p}": None for p in PERCENTILES},
+        "exposure": dict.fromkeys(BANDS, 0),
+        "exposure_s": dict.fromkeys(BANDS, 0),
+        "exposure_pct": dict.fromkeys(BANDS, 0),
+        "bad_minutes": 0,
+        "thresholds": {"good": good_threshold, "bad": bad_threshold},
+    }
+    if not n:
+        return result
+
+    ppm = series.ppm
+    result["avg"] = round(float(ppm.mean()))
+    result["min"] = int(ppm.min())
+    result["max"] = int(ppm.max())
+
+    # nearest-rank, as the dashboard has always shown them
+    values = np.percentile(ppm, PERCENTILES, method="inverted_cdf")
+    for p, v in zip(PERCENTILES, values):
+        result["percentiles"][f"p{p}"] = int(v)
+
+    band = bands(ppm, good_threshold, bad_threshold)
+    counts = np.bincount(band, minlength=3)
+    seconds = np.bincount(band, weights=durations(series), minlength=3)
+    covered = seconds.sum()
+
+    for i, name in enumerate(BANDS):
+        result["exposure"][name] = int(counts[i])
+        result["exposure_s"][name] = int(seconds[i])
+        result["exposure_pct"][name] = round(float(seconds[i] / covered * 100)) if covered else 0
+
+    result["bad_minutes"] = round(float(seconds[2]) / 60)
+    return result
+
+
+def histogram(series, bin_width=50):
+    """Reading counts per ppm bin: {"bin_width", "start", "counts"}."""
+    if not len(series):
+        return {"bin_width": bin_width, "start": None, "counts": []}
+
+    low = int(series.ppm.min())
+    low -= low % bin_width
+    counts = np.bincount((series.ppm - low) // bin_width)
+    return {"bin_width": bin_width, "start": low, "counts": counts.tolist()}
+
+
+def daily_profile(series):
+    """Average, maximum and reading count per UTC hour of day."""
+    hours = (series.ts // 3600) % 24
+    counts = np.bincount(hours, minlength=24)
+    sums = np.bincount(hours, weights=series.ppm, minlength=24)
+
+    # 24 masked reductions are several times faster than np.maximum.at
+    maxima = [series.ppm[hours == h].max() if counts[h] else None for h in range(24)]
+
+    return [
+        {
+            "hour": h,
+            "count": int(counts[h]),
+            "avg": round(float(sums[h] / counts[h])) if counts[h] else None,
+            "max": int(maxima[h]) if counts[h] else None,
+        }
+        for h in range(24)
+    ]
+
+
+def rollup_stats(start, end, settings, sensor_id=DEFAULT_SENSOR):
+    """range_stats() without histogram / profile, from the rollup tables
+    (long ranges). The same figures, but percentiles are None: they need
+    every reading. None while the rollups are built with other thresholds."""
+    totals = rollups.totals(start, end, thresholds(settings), sensor_id)
+    if totals is None:
+        return None
+
+    stats = summary(Series(start, end, np.zeros(0, np.int64), np.zeros(0, np.int32)),
+                    settings["good_threshold"], settings["bad_threshold"])
+    n = totals["n"]
+    if n:
+        stats["count"] = n
+        stats["avg"] = round(totals["sum"] / n)
+        stats["min"] = totals["min"]
+        stats["max"] = totals["max"]
+
+        counts = (n - totals["n_over_good"], totals["n_over_good"] - totals["n_over_bad"], totals["n_over_bad"])
+        seconds = (totals["secs"] - totals["s_over_good"],
+                   totals["s_over_good"] - totals["s_over_bad"], totals["s_over_bad"])
+        covered = totals["secs"]
+        for i, name in enumerate(BANDS):
+            stats["exposure"][name] = counts[i]
+            stats["exposure_s"][name] = seconds[i]
+            stats["exposure_pct"][name] = round(seconds[i] / covered * 100) if covered else 0
+        stats["bad_minutes"] = round(seconds[2] / 60)
+
+    stats["from"] = start
+    stats["to"] = end
+    stats["sensor_id"] = sensor_id
+    return stats
+
+
+def range_stats(start, end, settings, sensor_id=DEFAULT_SENSOR, bin_width=None, profile=False,
+                series=None):
+    # series: the range already loaded (range_cache)
+    if series is None:
+        series = load(start, end, sensor_id)
+    else:
+        series = Series(start, end, series.ts, series.ppm)
+    stats = summary(series, settings["good_threshold"], settings["bad_threshold"])
+    stats["from"] = start
+    stats["to"] = end
+    stats["sensor_id"] = sensor_id
+
+    if bin_width:
+        stats["histogram"] = histogram(series, bin_width)
+    if profile:
+        stats["daily_profile"] = daily_profile(series)
+    return stats
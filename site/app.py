@@ -1,265 +1,768 @@
-from flask import Flask, jsonify, render_template, request, make_response
-import random
+from flask import Blueprint, Flask, Response, g, jsonify, render_template, request, make_response
 import time
-from datetime import datetime, date
+import functools
+from datetime import datetime, date, timezone
+import math
 import os
-from database import get_db, init_db
-import json
+import sqlite3
+from database import DB_PATH, DEFAULT_SENSOR, init_db, pool_stats
 from flask import send_file
 import io
-from weasyprint import HTML
 
-from fake_co2 import generate_co2, save_reading
-
-
-app = Flask(__name__)
-
-init_db()
-
-def load_settings():
-    db = get_db()
-    rows = db.execute("SELECT key, value FROM settings").fetchall()
-    db.close()
-
-    settings = DEFAULT_SETTINGS.copy()
-    for r in rows:
-        settings[r["key"]] = json.loads(r["value"])
-
-    return settings
-
-print("=" * 50)
-print(f"Current directory: {os.getcwd()}")
-print(f"Template folder exists: {os.path.exists('templates')}")
-if os.path.exists('templates'):
-    print(f"Files in templates/: {os.listdir('templates')}")
-print("=" * 50)
-
-DEFAULT_SETTINGS = {
-    "analysis_running": True,
-    "good_threshold": 800,
-    "bad_threshold": 1200,
-    "alert_threshold": 1400,
-    "realistic_mode": True,
-    "update_speed": 1,
-}
-
-def save_settings(data):
-    db = get_db()
-    for k, v in data.items():
-        db.execute(
-            "REPLACE INTO settings (key, value) VALUES (?, ?)",
-            (k, json.dumps(v))
-        )
-    db.commit()
-    db.close()
+from config import DEFAULT_SETTINGS, load_settings, save_settings, reset_settings, settings_etag
+from acquisition import MIN_UPDATE_SPEED, AcquisitionEngine
+from ingest import get_writer
+from history import DAY, MAX_PAGE_SIZE, MAX_POINTS, PAGE_SIZE, RESOLUTIONS, Rows, bounds_from_args, columns, parse_time, data_version, fetch_page, fetch_readings, fetch_series, pick_resolution, range_bounds
+import rollups
+from stream import broker, format_event
+from downsample import downsample
+from reports import ReportService
+from shared_state import SharedStateFollower
+from sensors import LatestCache, list_sensors, sensor_exists, set_room, valid_sensor_id
+from rolling import LiveStats
+import alerts
+import readings
+import config
+import metrics
+import export
+import compression
+from range_cache import RangeCache
+
+
+bp = Blueprint("aerium", __name__)
+
+acquisition = AcquisitionEngine(load_settings)
+acquisition.add_listener(lambda latest: publish_latest(DEFAULT_SENSOR, latest))
+
+# per-sensor latest values (single-process mode)
+latest_cache = LatestCache()
+
+# rolling 5 min / 1 h / today statistics, updated with every live reading
+live_stats = LiveStats(load_settings, fetch_readings)
+
+# named history / stats ranges, only the tail is re-read (ingest listener)
+range_cache = RangeCache()
+
+# threshold crossings, evaluated once per stored reading (ingest hook)
+alert_engine = alerts.AlertEngine(load_settings)
+
+# set by use_shared_state() in multi-process mode
+_shared = None
+
+MAX_DOWNSAMPLE_POINTS = 10000
+REPORT_CACHE_DIR = "data/reports"
+REPORT_TIMEOUT_S = 60
+MAX_READINGS_BODY = 8 * 1024 * 1024
+# database busy (locked, no pool connection): nodes retry the batch after
+READINGS_RETRY_AFTER_S = 5
+# /api/stats over longer ranges is computed from the rollups
+ROLLUP_STATS_MIN_S = DAY
 
 # 1. ROOT ROUTE - DASHBOARD (MUST BE FIRST!)
-@app.route("/")
+@bp.route("/")
 def index():
     return render_template("index.html")  # Dashboard page
 
-@app.route("/live")
+@bp.route("/live")
 def live_page():
     return render_template("live.html")  # Settings page
 
 # 2. SETTINGS ROUTE
-@app.route("/settings")
+@bp.route("/settings")
 def settings_page():
     return render_template("settings.html")  # Settings page
 
-@app.route("/analytics")
+@bp.route("/analytics")
 def analytics():
     return render_template("analytics.html")
 
-@app.route("/api/history/<range>")
-def history_range(range):
-    db = get_db()
-
-    if range == "today":
-        rows = db.execute("""
-            SELECT ppm, timestamp
-            FROM co2_readings
-            WHERE date(timestamp) = date('now')
-            ORDER BY timestamp
-        """).fetchall()
-
-    elif range == "7d":
-        rows = db.execute("""
-            SELECT ppm, timestamp
-            FROM co2_readings
-            WHERE timestamp >= datetime('now', '-7 days')
-            ORDER BY timestamp
-        """).fetchall()
-
-    elif range == "30d":
-        rows = db.execute("""
-            SELECT ppm, timestamp
-            FROM co2_readings
-            WHERE timestamp >= datetime('now', '-30 days')
-            ORDER BY timestamp
-        """).fetchall()
+@bp.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@bp.after_app_request
+def record_request(resp):
+    elapsed = time.perf_counter() - g.request_start
+    req = request._get_current_object()  # one context lookup, not three
+    # labelled by URL rule, not path, to keep the series count bounded
+    route = req.url_rule.rule if req.url_rule is not None else "unmatched"
+    metrics.http_duration.observe(elapsed, req.method, route)
+    metrics.http_responses.inc(req.method, route, resp.status_code)
+    return resp
 
+def compressed(view):
+    # gzip / brotli as negotiated with the client (history, stats)
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        resp = make_response(view(*args, **kwargs))
+        return compression.compress_response(resp, request.accept_encodings)
+    return wrapper
+
+def request_sensor():
+    # ?sensor=<id>, the built-in sensor when absent; raises ValueError
+    sensor_id = request.args.get("sensor", DEFAULT_SENSOR)
+    if not valid_sensor_id(sensor_id):
+        raise ValueError("Invalid sensor")
+    return sensor_id
+
+def history_response(start, end, sensor_id, name=None):
+    # name: a named range (today, 7d, 30d), served through range_cache;
+    # ?format=columnar answers {"t0", "dt": [...], "ppm": [...]} (history.columns)
+    resolution = request.args.get("resolution", "auto")
+    if resolution != "auto" and resolution not in RESOLUTIONS:
+        return jsonify({"error": "Invalid resolution"}), 400
+
+    fmt = request.args.get("format", "rows")
+    if fmt not in ("rows", "columnar"):
+        return jsonify({"error": "format must be rows or columnar"}), 400
+
+    points = request.args.get("points", type=int)
+    if points is not None and not 3 <= points <= MAX_DOWNSAMPLE_POINTS:
+        return jsonify({"error": f"points must be 3..{MAX_DOWNSAMPLE_POINTS}"}), 400
+
+    # give LTTB a finer series than it returns, it picks the points to keep
+    max_points = MAX_POINTS if points is None else points * 10
+
+    if name is None:
+        cached = None
+        rows = fetch_series(start, end, resolution, max_points=max_points, sensor_id=sensor_id)
     else:
-        db.close()
+        if resolution == "auto":
+            resolution = pick_resolution(start, end, max_points, sensor_id)
+        cached = range_cache.get(
+            ("history", sensor_id, name, resolution), sensor_id, start, end, Rows(resolution)
+        )
+        rows = cached.rows
+
+    if points is None:
+        if fmt == "columnar":
+            return jsonify(columns(rows))
+        if cached is not None:
+            return Response(cached.json(), mimetype="application/json")
+        return jsonify(rows)
+
+    kept = downsample(rows, points)
+    resp = make_response(jsonify(columns(kept) if fmt == "columnar" else kept))
+    resp.headers["X-Original-Count"] = str(len(rows))
+    if rows:
+        resp.headers["X-Span-Start"] = str(rows[0]["ts"])
+        resp.headers["X-Span-End"] = str(rows[-1]["ts"])
+    return resp
+
+@bp.route("/api/history")
+@compressed
+def api_history():
+    # cost follows the rows in [from, to) of one sensor, not the table
+    # size ((sensor_id, ts) is the key)
+    try:
+        sensor_id = request_sensor()
+        start, end = bounds_from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return history_response(start, end, sensor_id)
+
+@bp.route("/api/history/<range>")
+@compressed
+def history_range(range):
+    try:
+        sensor_id = request_sensor()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    bounds = range_bounds(range)
+    if bounds is None:
         return jsonify({"error": "Invalid range"}), 400
 
-    db.close()
-    return jsonify([dict(r) for r in rows])
+    return history_response(*bounds, sensor_id, name=range)
+
+def publish_latest(sensor_id, latest):
+    latest = dict(latest, sensor_id=sensor_id)
+    if _shared is not None:
+        # every worker's follower broadcasts it to its own clients
+        if not _shared.write_latest(sensor_id, latest):
+            print(f"[shared-state] no free slot for sensor {sensor_id}")
+        return
+
+    latest_cache.update(sensor_id, latest)
+    broadcast_latest(sensor_id, latest)
+
+def observe_sample_age(latest, via):
+    if latest and latest["timestamp"]:
+        ts = datetime.fromisoformat(latest["timestamp"]).replace(tzinfo=timezone.utc).timestamp()
+        metrics.sample_age.observe(max(0.0, time.time() - ts), via)
+
+def broadcast_latest(sensor_id, latest):
+    # to this process' SSE clients, with the live statistics it moves
+    broker.publish("latest", latest, topic=sensor_id)
+    observe_sample_age(latest, "stream")
+    if latest["ppm"] is not None:
+        live_stats.add(sensor_id, parse_time(latest["timestamp"]), latest["ppm"])
+    broker.publish("stats", live_stats.snapshot(sensor_id), topic=sensor_id)
+
+def current_latest(sensor_id=DEFAULT_SENSOR):
+    if _shared is not None:
+        return _shared.read_latest(sensor_id) or latest_cache.get(sensor_id)
+    return latest_cache.get(sensor_id)
 
 # 3. API ROUTES
-@app.route("/api/latest")
+@bp.route("/api/latest")
 def api_latest():
+    # read-only: sampling happens in the acquisition thread (or process)
+    try:
+        sensor_id = request_sensor()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    latest = current_latest(sensor_id)
+    observe_sample_age(latest, "api")
+
+    resp = make_response(jsonify(latest))
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+def range_stats(*args, **kwargs):
+    # NumPy adds ~0.1 s to every start: load the analytics on first use
+    from analysis import range_stats
+    return range_stats(*args, **kwargs)
+
+@bp.route("/api/stats")
+@compressed
+def api_stats():
+    # summary of a range: ?range=today|7d|30d or ?from=&to=
+    try:
+        sensor_id = request_sensor()
+        start, end = bounds_from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # optional extras: ?histogram=<bin width in ppm> and ?profile=1 (by hour)
+    bin_width = request.args.get("histogram", type=int)
+    if bin_width is not None and not 1 <= bin_width <= 1000:
+        return jsonify({"error": "histogram bin width must be 1..1000"}), 400
+
+    profile = request.args.get("profile") == "1"
     settings = load_settings()
 
-    if not settings["analysis_running"]:
-        resp = make_response(jsonify({
-            "analysis_running": False,
-            "ppm": None
-        }))
-        resp.headers["Cache-Control"] = "no-store"
-        return resp
-
-    ppm = generate_co2(settings["realistic_mode"])
-    save_reading(ppm)
-
-    resp = make_response(jsonify({
-        "analysis_running": True,
-        "ppm": ppm,
-        "timestamp": datetime.utcnow().isoformat()
-    }))
+    # long ranges come from the rollups (no percentiles) unless every
+    # reading is needed: ?exact=1, histogram or profile
+    if end - start > ROLLUP_STATS_MIN_S and not bin_width and not profile and request.args.get("exact") != "1":
+        from analysis import rollup_stats
+        stats = rollup_stats(start, end, settings, sensor_id)
+        if stats is not None:  # None while a threshold change is rebuilding them
+            return jsonify(stats)
+
+    series = None
+    if "range" in request.args:
+        # named ranges slide with the clock: keep the loaded readings
+        from analysis import SERIES
+        series = range_cache.get(
+            ("stats", sensor_id, request.args["range"]), sensor_id, start, end, SERIES
+        )
+
+    return jsonify(range_stats(
+        start, end, settings, sensor_id,
+        bin_width=bin_width, profile=profile, series=series
+    ))
+
+@bp.route("/api/stats/live")
+def api_stats_live():
+    # rolling windows kept in memory: no database access once warm
+    try:
+        sensor_id = request_sensor()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not sensor_exists(sensor_id):
+        return jsonify({"error": "Unknown sensor"}), 404
+
+    resp = make_response(jsonify(live_stats.snapshot(sensor_id)))
     resp.headers["Cache-Control"] = "no-store"
     return resp
 
-@app.route("/api/history/today")
+def alerts_written(rows):
+    # ingest listener, after commit
+    if not alert_engine.take_written():
+        return
+    if _shared is not None:
+        # every worker's follower reads them back for its own clients
+        _shared.bump_alerts()
+    else:
+        broadcast_alerts()
+
+def broadcast_alerts():
+    for event in alert_engine.poll():
+        broker.publish("alert", event, topic=event["sensor_id"])
+
+@bp.route("/api/alerts")
+def api_alerts():
+    # newest first; ?sensor= &from= &to= &limit=
+    try:
+        sensor_id = request_sensor() if "sensor" in request.args else None
+        start = parse_time(request.args["from"]) if "from" in request.args else None
+        end = parse_time(request.args["to"]) if "to" in request.args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify(alerts.fetch_events(sensor_id, start, end, limit=max(1, limit)))
+
+@bp.route("/api/stream")
+def api_stream():
+    # one long-lived connection per tab: readings of one sensor, pause
+    # state, settings
+    try:
+        sensor_id = request_sensor()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    initial = [
+        format_event("settings", load_settings()),
+        format_event("latest", current_latest(sensor_id)),
+    ]
+    if sensor_exists(sensor_id):
+        initial.append(format_event("stats", live_stats.snapshot(sensor_id)))
+
+    resp = Response(
+        broker.stream(initial, topics=[sensor_id]),
+        mimetype="text/event-stream"
+    )
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+@bp.route("/api/history/today")
 def api_history_today():
-    db = get_db()
-    rows = db.execute("""
-        SELECT ppm, timestamp
-        FROM co2_readings
-        WHERE date(timestamp) = date('now')
-        ORDER BY timestamp
-    """).fetchall()
-    db.close()
-
-    return jsonify([dict(r) for r in rows])
-
-def get_today_history():
-    db = get_db()
-    rows = db.execute("""
-        SELECT ppm, timestamp
-        FROM co2_readings
-        WHERE date(timestamp) = date('now')
-        ORDER BY timestamp
-    """).fetchall()
-    db.close()
-
-    return [dict(r) for r in rows]
-
-
-@app.route("/api/settings", methods=["GET", "POST", "DELETE"])
+    return history_range("today")
+
+def settings_changed():
+    acquisition.refresh()
+
+    after = load_settings()
+    if _shared is None:
+        # with shared state every worker's follower publishes it instead
+        broker.publish("settings", after)
+
+    # the rollups' time above each threshold was computed with the old ones
+    thresholds = config.thresholds(after)
+    if rollups.state()[0] != thresholds:
+        rollups.rebuild_async(thresholds)
+
+THRESHOLD_KEYS = ("good_threshold", "bad_threshold", "alert_threshold")
+
+def is_number(value):
+    # JSON true/false are ints to Python; NaN and Infinity parse as floats
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and math.isfinite(value)
+
+@bp.route("/api/settings", methods=["GET", "POST", "DELETE"])
 def api_settings():
     if request.method == "POST":
-        save_settings(request.json)
+        data = request.json
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        speed = data.get("update_speed")
+        if speed is not None and (not is_number(speed) or speed < MIN_UPDATE_SPEED):
+            return jsonify({"error": f"update_speed must be at least {MIN_UPDATE_SPEED} s"}), 400
+        for key in THRESHOLD_KEYS:
+            if key in data and not (is_number(data[key]) and data[key] > 0):
+                return jsonify({"error": f"{key} must be a positive number"}), 400
+        merged = {**load_settings(), **data}
+        if merged["good_threshold"] >= merged["bad_threshold"]:
+            return jsonify({"error": "good_threshold must be below bad_threshold"}), 400
+        save_settings(data)
+        settings_changed()
         return jsonify({"status": "ok"})
 
     if request.method == "DELETE":
-        db = get_db()
-        db.execute("DELETE FROM settings")
-        db.commit()
-        db.close()
+        reset_settings()
+        settings_changed()
         return jsonify(DEFAULT_SETTINGS)
 
-    return jsonify(load_settings())
-
-@app.route("/api/history/latest/<int:limit>")
+    # served from the in-memory cache; unchanged settings answer 304
+    resp = make_response(jsonify(load_settings()))
+    resp.set_etag(settings_etag())
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+@bp.route("/api/db/stats")
+def api_db_stats():
+    return jsonify(pool_stats())
+
+@bp.route("/api/ingest/stats")
+def api_ingest_stats():
+    return jsonify(get_writer().stats())
+
+metrics.Sampled(
+    "aerium_ingest_queue_depth", "Readings waiting for the ingest writer.",
+    lambda: get_writer().stats()["pending"],
+)
+metrics.Sampled(
+    "aerium_ingest_rows_total", "Readings received, written, ignored as duplicates and dropped by the ingest writer.",
+    lambda: {(k,): v for k, v in get_writer().stats().items() if k in ("received", "written", "ignored", "dropped")},
+    type="counter", labels=("result",),
+)
+def pool_connections():
+    stats = pool_stats()
+    return {("in_use",): stats["in_use"], ("idle",): stats["idle"]}
+
+metrics.Sampled(
+    "aerium_db_pool_connections", "Pooled SQLite connections by state.",
+    pool_connections, labels=("state",),
+)
+def database_size():
+    # recent pages may still sit in the WAL file
+    paths = (DB_PATH, DB_PATH.with_name(DB_PATH.name + "-wal"))
+    return sum(p.stat().st_size for p in paths if p.exists())
+
+metrics.Sampled(
+    "aerium_db_size_bytes", "SQLite database file size, WAL included.",
+    database_size,
+)
+metrics.Sampled(
+    "aerium_range_cache_bytes", "Memory held by the history / stats range cache (estimate).",
+    lambda: range_cache.stats()["bytes"],
+)
+metrics.Sampled(
+    "aerium_range_cache_lookups_total", "Range cache lookups by result.",
+    lambda: {("hit",): range_cache.stats()["hits"], ("miss",): range_cache.stats()["misses"]},
+    type="counter", labels=("result",),
+)
+metrics.Sampled(
+    "aerium_sse_subscribers", "Open /api/stream connections.",
+    lambda: broker.stats()["subscribers"],
+)
+
+@bp.route("/metrics")
+def api_metrics():
+    # this process only: under serve.py every worker reports its own
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route("/api/readings", methods=["POST"])
+def api_readings():
+    # batches pushed by remote sensor nodes, see readings.py for the formats
+    if (request.content_length or 0) > MAX_READINGS_BODY:
+        return jsonify({"error": "Body too large"}), 413
+
+    try:
+        header, batch = readings.parse_body(
+            request.mimetype, request.get_data(cache=False), request.args
+        )
+        result, rows = readings.ingest(header, batch)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except (sqlite3.OperationalError, TimeoutError) as e:
+        # nothing was stored (the batch and its seq claim roll back together)
+        print(f"[readings] batch not stored, database busy: {e}")
+        resp = jsonify({"error": "Database busy, retry later"})
+        resp.headers["Retry-After"] = str(READINGS_RETRY_AFTER_S)
+        return resp, 503
+
+    if rows:
+        sensor_id = result["sensor_id"]
+        live_stats.add_many(sensor_id, rows)
+
+        latest = current_latest(sensor_id)
+        # late batches (a node catching up) must not move the live value back
+        if latest["timestamp"] is None or parse_time(latest["timestamp"]) <= rows[-1][0]:
+            publish_latest(sensor_id, readings.latest_of(rows[-1]))
+
+    return jsonify(result)
+
+@bp.route("/api/sensors")
+def api_sensors():
+    # every room at a glance: registry plus the cached latest value
+    return jsonify([
+        dict(sensor, latest=current_latest(sensor["sensor_id"]))
+        for sensor in list_sensors()
+    ])
+
+@bp.route("/api/sensors/<sensor_id>", methods=["PUT"])
+def api_sensor_update(sensor_id):
+    room = (request.json or {}).get("room")
+    if room is not None and not isinstance(room, str):
+        return jsonify({"error": "room must be a string"}), 400
+
+    if not set_room(sensor_id, room):
+        return jsonify({"error": "Unknown sensor"}), 404
+    return jsonify({"status": "ok"})
+
+@bp.route("/api/history/latest/<int:limit>")
+@compressed
 def api_history_latest(limit):
-    db = get_db()
-    rows = db.execute("""
-        SELECT id, ppm, timestamp
-        FROM co2_readings
-        ORDER BY id DESC
-        LIMIT ?
-    """, (limit,)).fetchall()
-    db.close()
-
-    # reverse so oldest → newest
-    return jsonify([dict(r) for r in reversed(rows)])
+    try:
+        sensor_id = request_sensor()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if limit < 1:
+        return jsonify([])
+    rows, _ = fetch_page(sensor_id, limit=min(limit, MAX_PAGE_SIZE))
+    return jsonify(rows)
+
+@bp.route("/api/history/page")
+@compressed
+def api_history_page():
+    # keyset pagination: ?after_ts= pages forward, ?before_ts= back, neither
+    # gives the newest page; "next" holds the cursor of the following page
+    try:
+        sensor_id = request_sensor()
+        after = parse_time(request.args["after_ts"]) if "after_ts" in request.args else None
+        before = parse_time(request.args["before_ts"]) if "before_ts" in request.args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    limit = request.args.get("limit", PAGE_SIZE, type=int)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be 1..{MAX_PAGE_SIZE}"}), 400
+
+    rows, more = fetch_page(sensor_id, after, before, limit)
+    next_page = None
+    if more and after is not None:
+        next_page = {"after_ts": rows[-1]["ts"]}
+    elif more:
+        next_page = {"before_ts": rows[0]["ts"]}
+
+    return jsonify({"sensor_id": sensor_id, "readings": rows, "next": next_page})
+
+@bp.route("/api/export")
+def api_export():
+    # raw readings of [from, to) (or ?range=) as a streamed download,
+    # ?format=csv|ndjson; gzip when the client accepts it
+    try:
+        sensor_id = request_sensor()
+        start, end = bounds_from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    fmt = request.args.get("format", "csv")
+    if fmt not in export.FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    chunks = export.export_lines(sensor_id, start, end, fmt)
+    gzipped = request.accept_encodings["gzip"] > 0
+    if gzipped:
+        chunks = export.gzip_chunks(chunks)
+
+    resp = Response(chunks, mimetype=export.FORMATS[fmt]["mimetype"])
+    if gzipped:
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Content-Disposition"] = (
+        f'attachment; filename="aerium_{sensor_id}_{start}_{end}.{fmt}"'
+    )
+    return resp
 
 
-def generate_pdf(html):
-    pdf_io = io.BytesIO()
+def render_pdf(html):
+    # WeasyPrint is by far the slowest import: only load it for the first report
+    from weasyprint import HTML
 
-    HTML(
+    start = time.perf_counter()
+    pdf = HTML(
         string=html,
         base_url=os.path.abspath(".")
-    ).write_pdf(
-        target=pdf_io,
-        presentational_hints=True
-    )
-
-    pdf_io.seek(0)
-
+    ).write_pdf(presentational_hints=True)
+    metrics.pdf_render.observe(time.perf_counter() - start)
+    return pdf
+
+_reports = None
+
+def get_reports():
+    global _reports
+    if _reports is None:
+        _reports = ReportService(render_pdf, REPORT_CACHE_DIR)
+    return _reports
+
+_report_css = (None, "")
+
+def load_report_css():
+    # re-read only when the file changes
+    global _report_css
+    path = "static/css/report.css"
+    mtime = os.path.getmtime(path)
+    if _report_css[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            _report_css = (mtime, f.read())
+    return _report_css[1]
+
+def pdf_response(pdf):
     return send_file(
-        pdf_io,
+        io.BytesIO(pdf),
         mimetype="application/pdf",
         as_attachment=False,
         download_name="daily_report.pdf"
     )
 
-
-@app.route("/api/report/daily/pdf")
-def export_daily_pdf():
-    data = get_today_history()
+def daily_report(day, sensor_id=DEFAULT_SENSOR):
+    """(key, persistent, html_factory) for one sensor's report of a UTC day."""
     settings = load_settings()
+    start = int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+    today = day == datetime.now(timezone.utc).date()
+    end = int(time.time()) + 1 if today else start + DAY
+
+    # the data version is in the key for past days too: nodes upload late
+    # readings, and a cached report must not hide them
+    thresholds = (settings["good_threshold"], settings["bad_threshold"])
+    version = data_version(start, end, sensor_id)
+    key = ("daily", sensor_id, day.isoformat(), *thresholds, version)
+
+    def build_html():
+        stats = range_stats(start, end, settings, sensor_id)
+        if not stats["count"]:
+            return None
+
+        return render_template(
+            "report_daily.html",
+            date=day.strftime("%d %B %Y"),
+            sensor=sensor_label(sensor_id),
+            avg=stats["avg"],
+            max=stats["max"],
+            min=stats["min"],
+            bad_minutes=stats["bad_minutes"],
+            good_pct=stats["exposure_pct"]["good"],
+            medium_pct=stats["exposure_pct"]["medium"],
+            bad_pct=stats["exposure_pct"]["bad"],
+            good_threshold=settings["good_threshold"],
+            bad_threshold=settings["bad_threshold"],
+            generated_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            report_css=load_report_css()
+        )
 
-    if not data:
-        return "No data", 400
-
-    values = [d["ppm"] for d in data]
-
-    avg = round(sum(values) / len(values))
-    max_ppm = max(values)
-    min_ppm = min(values)
+    return key, not today, build_html
 
-    # ⏱ minutes above bad threshold
-    bad_minutes = sum(1 for v in values if v >= settings["bad_threshold"])
+def sensor_label(sensor_id):
+    room = next((s["room"] for s in list_sensors() if s["sensor_id"] == sensor_id), None)
+    return room or sensor_id
 
-    # ✅ EXPOSURE BREAKDOWN (THIS IS YOUR QUESTION)
-    good = sum(1 for v in values if v < settings["good_threshold"])
-    medium = sum(
-        1 for v in values
-        if settings["good_threshold"] <= v < settings["bad_threshold"]
-    )
-    bad = sum(1 for v in values if v >= settings["bad_threshold"])
-    total = len(values)
-
-    good_pct = round(good / total * 100)
-    medium_pct = round(medium / total * 100)
-    bad_pct = round(bad / total * 100)
-
-    with open("static/css/report.css", "r", encoding="utf-8") as f:
-        report_css = f.read()
-
-    html = render_template(
-        "report_daily.html",
-        date=date.today().strftime("%d %B %Y"),
-        avg=avg,
-        max=max_ppm,
-        min=min_ppm,
-        bad_minutes=bad_minutes,
-        good_pct=good_pct,
-        medium_pct=medium_pct,
-        bad_pct=bad_pct,
-        good_threshold=settings["good_threshold"],
-        bad_threshold=settings["bad_threshold"],
-        generated_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        report_css=report_css
-    )
+def report_day():
+    value = request.args.get("date")
+    if not value:
+        return datetime.now(timezone.utc).date()
+    return date.fromisoformat(value)
 
-    return generate_pdf(html)
+@bp.route("/api/report/daily", methods=["POST"])
+def api_report_daily():
+    # queue a render and return a job id to poll
+    try:
+        day = report_day()
+        sensor_id = request_sensor()
+    except ValueError:
+        return jsonify({"error": "Invalid date or sensor"}), 400
 
+    key, persistent, build_html = daily_report(day, sensor_id)
 
+    if get_reports().cached(key, persistent) is not None:
+        job = get_reports().completed(key)
+    else:
+        html = build_html()
+        if html is None:
+            return jsonify({"error": "No data"}), 400
+        job = get_reports().submit(key, html, persistent)
+
+    return jsonify(job_status(job)), 200 if job.status == "done" else 202
+
+def job_status(job):
+    status = job.to_dict()
+    if job.status == "done":
+        status["download"] = f"/api/report/jobs/{job.id}/pdf"
+    return status
+
+@bp.route("/api/report/jobs/<job_id>")
+def api_report_job(job_id):
+    job = get_reports().job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job_status(job))
+
+@bp.route("/api/report/jobs/<job_id>/pdf")
+def api_report_job_pdf(job_id):
+    job = get_reports().job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job.status != "done":
+        return jsonify(job_status(job)), 409
+
+    pdf = get_reports().result(job)
+    if pdf is None:
+        return jsonify({"error": "Report expired, request it again"}), 410
+    return pdf_response(pdf)
+
+@bp.route("/api/report/daily/pdf")
+def export_daily_pdf():
+    # synchronous variant: served from cache, or waits for the shared job
+    try:
+        day = report_day()
+        sensor_id = request_sensor()
+    except ValueError:
+        return "Invalid date or sensor", 400
+
+    key, persistent, build_html = daily_report(day, sensor_id)
+
+    pdf = get_reports().cached(key, persistent)
+    if pdf is None:
+        html = build_html()
+        if html is None:
+            return "No data", 400
+
+        job = get_reports().submit(key, html, persistent)
+        job.done.wait(REPORT_TIMEOUT_S)
+        if job.status != "done":
+            return job.error or "Report generation timed out", 503
+        pdf = get_reports().result(job)
+
+    return pdf_response(pdf)
+
+
+_services_started = False
+
+def start_services(acquire=True):
+    """Database schema, ingest writer and (optionally) the sampling thread."""
+    global _services_started
+    if _services_started:
+        return
+    _services_started = True
+
+    init_db()
+    rollups.ensure_built()
+    get_writer().add_hook(rollups.apply)
+    # a bad threshold setting must not stop readings from being stored
+    get_writer().add_hook(alert_engine.apply, isolated=True)
+    get_writer().add_listener(alerts_written)
+    get_writer().add_listener(range_cache.on_ingest)
+    alert_engine.poll()  # start the event cursor at the current end
+
+    if acquire:
+        acquisition.start()
+
+def use_shared_state(state, publish=True):
+    """Multi-process mode (serve.py): latest value and settings version come
+    from shared memory instead of this process' acquisition thread."""
+    global _shared
+    _shared = state
+    config.use_shared_state(state, boot=state.name)
+
+    if publish:
+        SharedStateFollower(
+            state,
+            on_latest=broadcast_latest,
+            on_settings=lambda: broker.publish("settings", load_settings()),
+            on_alerts=broadcast_alerts,
+        ).start()
+
+def create_app(start=True, acquire=True, shared_state=None):
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+
+    if shared_state is not None:
+        use_shared_state(shared_state)
+
+    if start:
+        start_services(acquire)
+
+    return app
 
 
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # the debug reloader runs this file twice; only the serving child samples
+    app = create_app(acquire=os.environ.get("WERKZEUG_RUN_MAIN") == "true")
+    app.run(debug=True, host='0.0.0.0', port=5000)
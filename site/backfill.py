@@ -0,0 +1,196 @@
+# backfill.py
+# Synthetic history for load tests and capacity planning: months of
+# readings for many sensors, generated as NumPy arrays and written in large
+# transactions, then rolled up. Each room follows a CO2 mass balance:
+# occupants from a school timetable push the level up, ventilation pulls
+# it back towards outdoor air (faster while windows are open during
+# breaks), with sensor noise and outages on top.
+#
+#   python backfill.py --sensors 20 --days 90
+#   python backfill.py --sensor default --days 30 --interval 10
+import argparse
+import time
+
+import numpy as np
+
+import database
+import rollups
+from analysis import PPM_BITS, PPM_MASK
+from sensors import valid_sensor_id
+
+CHUNK = 200_000  # rows per transaction
+
+OUTDOOR_PPM = 420
+# CO2 exhaled by a seated person, m³ per minute
+EXHALED_M3_MIN = 0.3e-3
+
+# minutes of the (UTC) day, Monday to Friday
+LESSONS = [(480, 600), (615, 720), (810, 900), (915, 1020)]
+BREAKS = [(600, 615), (900, 915)]  # windows opened, room mostly empty
+LUNCH = (720, 810)
+
+UNUSED_LESSON_P = 0.15
+OUTAGES_PER_DAY = 1 / 7
+OUTAGE_MEAN_S = 45 * 60
+
+# one statement per chunk: SQLite unpacks a JSON array of packed
+# (ts - first) << 16 | ppm values itself, 2-3x faster than executemany
+INSERT_SQL = f"""
+    INSERT OR IGNORE INTO co2_readings (sensor_id, ts, ppm)
+    SELECT ?, ? + (value >> {PPM_BITS}), value & {PPM_MASK} FROM json_each(?)
+"""
+SENSOR_SQL = """
+    INSERT OR IGNORE INTO sensors (sensor_id, room, created_at)
+    VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+"""
+
+
+def room(rng):
+    """Random physical parameters of one classroom."""
+    return {
+        "volume_m3": rng.uniform(120, 250),
+        "occupants": int(rng.integers(15, 31)),
+        "ach": rng.uniform(0.8, 3.0),          # air changes per hour, closed
+        "ach_open": rng.uniform(8, 20),        # windows open
+        "shift_min": int(rng.integers(-15, 16)),
+        "noise_ppm": rng.uniform(5, 15),
+    }
+
+
+def decay(target, rate, c0, block=60):
+    """Solve c[m] = target[m] + (c[m-1] - target[m]) * exp(-rate[m]).
+
+    The recurrence is linear, so each block of `block` steps is solved
+    from a zero start with cumprod / cumsum, for all blocks at once; only
+    the block start values are chained in Python. rate * block must stay
+    well under ~700 for the products to remain representable.
+    """
+    n = len(target)
+    pad = -n % block
+    a = np.exp(-np.pad(rate, (0, pad))).reshape(-1, block)
+    b = (1 - a) * np.pad(target, (0, pad)).reshape(-1, block)
+
+    A = np.cumprod(a, axis=1)
+    z = A * np.cumsum(b / A, axis=1)  # block solution from c = 0
+
+    starts = np.empty(len(a))
+    c = c0
+    for i, (gain, offset) in enumerate(zip(A[:, -1].tolist(), z[:, -1].tolist())):
+        starts[i] = c
+        c = gain * c + offset
+    return (A * starts[:, None] + z).ravel()[:n]
+
+
+def simulate(params, start, end, rng):
+    """Per-minute CO2 level of one room over [start, end): (ts, ppm)."""
+    first = start - start % 60
+    tm = np.arange(first, end + 60, 60, dtype=np.int64)
+    day = (tm - first) // 86400
+    days = int(day[-1]) + 1
+    minute = (tm % 86400) // 60 - params["shift_min"]
+    weekday = ((tm // 86400) + 3) % 7 < 5  # 1970-01-01 was a Thursday
+
+    # occupancy: per day attendance, some lessons held elsewhere
+    attendance = rng.uniform(0.75, 1.0, days)
+    used = rng.random((days, len(LESSONS))) > UNUSED_LESSON_P
+    people = np.zeros(len(tm))
+    for i, (lo, hi) in enumerate(LESSONS):
+        m = weekday & (minute >= lo) & (minute < hi)
+        people[m] = params["occupants"] * attendance[day[m]] * used[day[m], i]
+    for lo, hi in BREAKS + [LUNCH]:
+        m = weekday & (minute >= lo) & (minute < hi)
+        people[m] = params["occupants"] * 0.05
+
+    rate = np.full(len(tm), params["ach"] / 60)  # per minute
+    for lo, hi in BREAKS:
+        rate[weekday & (minute >= lo) & (minute < hi)] = params["ach_open"] / 60
+
+    outdoor = OUTDOOR_PPM + rng.normal(0, 8, days)[day]
+    generated = people * EXHALED_M3_MIN / params["volume_m3"] * 1e6  # ppm per minute
+    target = outdoor + generated / rate
+    return tm, decay(target, rate, OUTDOOR_PPM)
+
+
+def outages(start, end, rng):
+    """Sorted, non-overlapping (starts, ends) of sensor outages."""
+    n = rng.poisson((end - start) / 86400 * OUTAGES_PER_DAY)
+    starts = np.sort(rng.integers(start, end, n))
+    ends = starts + rng.exponential(OUTAGE_MEAN_S, n).astype(np.int64) + 60
+    ends[:-1] = np.minimum(ends[:-1], starts[1:])
+    return starts, ends
+
+
+def readings(params, start, end, interval=1, rng=None):
+    """(ts, ppm) int64 arrays of one sensor in [start, end), CHUNK rows at a time."""
+    rng = rng if rng is not None else np.random.default_rng()
+    tm, level = simulate(params, start, end, rng)
+    gap_starts, gap_ends = outages(start, end, rng)
+
+    step = CHUNK * interval
+    for lo in range(start, end, step):
+        ts = np.arange(lo, min(lo + step, end), interval, dtype=np.int64)
+        ppm = np.interp(ts, tm, level) + rng.normal(0, params["noise_ppm"], len(ts))
+
+        if len(gap_starts):
+            i = np.searchsorted(gap_starts, ts, side="right") - 1
+            keep = (i < 0) | (ts >= gap_ends[np.maximum(i, 0)])
+            ts, ppm = ts[keep], ppm[keep]
+        yield ts, np.clip(np.rint(ppm), 400, 5000).astype(np.int64)
+
+
+def backfill(sensor_ids, days, end=None, interval=1, seed=0, rebuild=True):
+    """Write `days` of history ending at `end` for each sensor; returns
+    the number of rows generated. Existing readings are kept."""
+    end = int(end if end is not None else time.time())
+    start = end - int(days * 86400)
+    database.init_db()
+
+    rows = 0
+    db = database.get_db()
+    db.execute("PRAGMA synchronous = OFF")
+    try:
+        for n, sensor_id in enumerate(sensor_ids):
+            rng = np.random.default_rng([seed, n])
+            for ts, ppm in readings(room(rng), start, end, interval, rng):
+                db.execute("BEGIN")
+                db.execute(SENSOR_SQL, (sensor_id, f"Salle {101 + n}"))
+                if len(ts):
+                    packed = ((ts - ts[0]) << PPM_BITS) | ppm
+                    values = "[" + ",".join(map(str, packed.tolist())) + "]"
+                    db.execute(INSERT_SQL, (sensor_id, int(ts[0]), values))
+                db.commit()
+                rows += len(ts)
+    finally:
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.close()
+
+    if rebuild:
+        rollups.rebuild(pause=0)  # nothing else is writing
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aerium synthetic history")
+    parser.add_argument("--sensors", type=int, default=1, help="number of rooms (room-01, room-02, ...)")
+    parser.add_argument("--sensor", action="append", help="sensor id, repeatable (instead of --sensors)")
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--interval", type=int, default=1, help="seconds between readings")
+    parser.add_argument("--end", type=int, help="epoch seconds (default now)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.interval < 1:
+        parser.error("--interval must be at least 1")
+    sensor_ids = args.sensor or [f"room-{i + 1:02d}" for i in range(args.sensors)]
+    for sensor_id in sensor_ids:
+        if not valid_sensor_id(sensor_id):
+            parser.error(f"invalid sensor id: {sensor_id}")
+
+    started = time.perf_counter()
+    rows = backfill(sensor_ids, args.days, args.end, args.interval, args.seed)
+    print(f"[backfill] {rows} readings for {len(sensor_ids)} sensor(s) "
+          f"in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
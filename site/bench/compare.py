@@ -0,0 +1,49 @@
+# bench/compare.py
+# Side-by-side view of two bench/run.py result files: every numeric metric
+# with its relative change.
+#
+#   python bench/compare.py bench/results/abc1234.json bench/results/def5678.json
+import json
+import sys
+
+# metrics where a higher value is better; everything else is a cost
+HIGHER_IS_BETTER = ("rps", "_per_s")
+
+
+def flatten(node, prefix=""):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, node
+
+
+def main(before_path, after_path):
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)
+
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    old = dict(flatten(before["results"]))
+    new = dict(flatten(after["results"]))
+
+    width = max((len(k) for k in new), default=0)
+    for key, value in new.items():
+        if key not in old:
+            print(f"{key:<{width}}  {'':>12}  {value:>12}  (new)")
+            continue
+        previous = old[key]
+        change = ""
+        if previous:
+            pct = (value - previous) / previous * 100
+            better = pct > 0 if key.endswith(HIGHER_IS_BETTER) else pct < 0
+            change = f"{pct:+.1f}%" + (" better" if better and abs(pct) >= 5 else
+                                       " worse" if not better and abs(pct) >= 5 else "")
+        print(f"{key:<{width}}  {previous:>12}  {value:>12}  {change}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: compare.py BEFORE.json AFTER.json")
+    main(sys.argv[1], sys.argv[2])
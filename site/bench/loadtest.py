@@ -0,0 +1,348 @@
+# bench/loadtest.py
+# Headless dashboards against a running instance. Live and overview pages
+# hold an /api/stream subscription as main.js does; analytics pages load
+# stats plus a downsampled series and switch range after a think time;
+# optional sensor nodes push batches to /api/readings. --polling replays
+# the request mix of the former polling frontend (mainancien.js) instead.
+#
+# Reports throughput, latency percentiles and errors per request kind, SSE
+# delivery (time to first event, sample age), and from the server's
+# /metrics the lock rate and database growth per minute (WAL included: a
+# short run overstates growth until the WAL reaches its steady size).
+# Under serve.py /metrics is per worker, so lock counts cover one worker.
+#
+#   python app.py &
+#   python bench/loadtest.py --live 50 --overview 20 --analytics 5 --nodes 2 --duration 60
+import argparse
+import http.client
+import json
+import random
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+from run import latency_summary, percentile
+
+TIMEOUT = 30
+RANGES = ("today", "7d", "30d")
+CHART_POINTS = 800  # analytics.js
+
+# former polling frontend: (seconds, request kind, path)
+POLLING = {
+    "live": [
+        (None, "latest", "/api/latest"),            # every pollingDelay
+        (2, "settings", "/api/settings"),           # initGlobalState
+        (2, "settings", "/api/settings"),           # startSystemStateWatcher
+    ],
+    "overview": [
+        (2, "settings", "/api/settings"),
+        (2, "settings", "/api/settings"),
+        (5, "latest", "/api/latest"),               # loadOverviewStats
+        (5, "history_today", "/api/history/today"),
+    ],
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}  # request kind -> [seconds]
+        self.errors = {}     # request kind -> count
+        self.events = {}     # SSE event name -> count
+        self.ages = []       # seconds, from "latest" events
+        self.streams = 0
+
+    def ok(self, kind, seconds):
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(seconds)
+
+    def error(self, kind):
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def event(self, name, data):
+        with self.lock:
+            self.events[name] = self.events.get(name, 0) + 1
+        if name == "latest":
+            try:
+                ts = datetime.fromisoformat(json.loads(data)["timestamp"])
+                age = time.time() - ts.replace(tzinfo=timezone.utc).timestamp()
+            except (ValueError, TypeError, KeyError):
+                return
+            with self.lock:
+                self.ages.append(age)
+
+
+def request(base, rec, kind, path, data=None, headers=None):
+    start = time.perf_counter()
+    try:
+        req = urllib.request.Request(base + path, data=data, headers=headers or {})
+        with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
+            body = resp.read()
+    except Exception:
+        rec.error(kind)
+        return None
+    rec.ok(kind, time.perf_counter() - start)
+    return body
+
+
+def wait(stop, seconds):
+    # True once the run is over
+    return stop.wait(max(0, seconds))
+
+
+def sse_client(base, rec, stop, page, sensor, sockets):
+    request(base, rec, "page", page)
+    url = urllib.parse.urlsplit(base)
+
+    while not stop.is_set():
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=TIMEOUT + 20)
+        sock = None
+        start = time.perf_counter()
+        try:
+            conn.request("GET", "/api/stream?" + urllib.parse.urlencode({"sensor": sensor}))
+            sock = conn.sock  # the response takes it over from conn
+            resp = conn.getresponse()
+            if resp.status != 200:
+                raise OSError(f"HTTP {resp.status}")
+            with rec.lock:
+                rec.streams += 1
+                sockets.add(sock)
+
+            first, event, data = True, None, []
+            while True:
+                line = resp.fp.readline()
+                if not line:
+                    break
+                line = line.decode().rstrip("\n")
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line and event:
+                    if first:
+                        rec.ok("stream_connect", time.perf_counter() - start)
+                        first = False
+                    rec.event(event, "\n".join(data))
+                    event, data = None, []
+            if not stop.is_set():
+                raise OSError("stream closed by the server")
+        except (OSError, http.client.HTTPException):
+            if stop.is_set():
+                break
+            rec.error("stream")
+            wait(stop, 3)  # EventSource reconnection delay
+        finally:
+            with rec.lock:
+                sockets.discard(sock)
+            conn.close()
+
+
+def polling_client(base, rec, stop, page, sensor, poll_delay):
+    query = "?" + urllib.parse.urlencode({"sensor": sensor})
+    request(base, rec, "page", page)
+    request(base, rec, "settings", "/api/settings")
+    if page == "/live":
+        request(base, rec, "history_latest", "/api/history/latest/1000" + query)
+
+    now = time.monotonic()
+    tasks = [
+        [now, interval or poll_delay, kind, path + (query if kind != "settings" else "")]
+        for interval, kind, path in POLLING["live" if page == "/live" else "overview"]
+    ]
+    while True:
+        task = min(tasks, key=lambda t: t[0])
+        if wait(stop, task[0] - time.monotonic()):
+            return
+        request(base, rec, task[2], task[3])
+        task[0] += task[1]
+
+
+def analytics_client(base, rec, stop, sensor, think):
+    request(base, rec, "page", "/analytics")
+    query = urllib.parse.urlencode({"sensor": sensor})
+    while not stop.is_set():
+        range_ = random.choice(RANGES)
+        request(base, rec, "stats", f"/api/stats?range={range_}&{query}")
+        request(base, rec, "history_points", f"/api/history/{range_}?points={CHART_POINTS}&{query}")
+        if wait(stop, random.uniform(0.5, 1.5) * think):
+            return
+
+
+def node_client(base, rec, stop, index, interval):
+    """A remote sensor node posting its 1 Hz readings every `interval` s."""
+    sensor = f"loadtest-{index}"
+    last = int(time.time())
+    while not wait(stop, interval):
+        now = int(time.time())
+        body = {
+            "sensor_id": sensor,
+            "node": f"loadtest-node-{index}",
+            "seq": time.time_ns() // 1000,  # increases across runs too
+            "readings": [[ts, random.randint(450, 1500)] for ts in range(last, now)],
+        }
+        last = now
+        request(base, rec, "readings_post", "/api/readings",
+                json.dumps(body).encode(), {"Content-Type": "application/json"})
+
+
+def scrape(base):
+    """{series: value} from /metrics, None if unavailable."""
+    try:
+        with urllib.request.urlopen(base + "/metrics", timeout=TIMEOUT) as resp:
+            text = resp.read().decode()
+    except Exception:
+        return None
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            series, _, value = line.rpartition(" ")
+            values[series] = float(value)
+    return values
+
+
+def metric(values, name):
+    # summed over labels
+    return sum(v for k, v in values.items() if k == name or k.startswith(name + "{"))
+
+
+def server_summary(before, after, minutes):
+    if before is None or after is None:
+        return {"error": "/metrics unavailable"}
+
+    def delta(name):
+        return metric(after, name) - metric(before, name)
+
+    return {
+        "locked": int(delta("aerium_sql_locked_total")),
+        "locked_per_min": round(delta("aerium_sql_locked_total") / minutes, 2),
+        "pool_timeouts": int(delta("aerium_db_pool_timeouts_total")),
+        "ingest_dropped": int(delta("aerium_ingest_rows_total{result=\"dropped\"}")),
+        "db_mb": round(metric(after, "aerium_db_size_bytes") / 2**20, 1),
+        "db_growth_mb_per_min": round(delta("aerium_db_size_bytes") / 2**20 / minutes, 3),
+    }
+
+
+def report(rec, wall, opts, before, after):
+    with rec.lock:
+        latencies = {k: list(v) for k, v in rec.latencies.items()}
+        errors = dict(rec.errors)
+        events = dict(rec.events)
+        ages = sorted(rec.ages)
+        streams = rec.streams
+
+    kinds = sorted(set(latencies) | set(errors))
+    requests = {k: latency_summary(latencies.get(k, []), errors.get(k, 0), wall) for k in kinds}
+    total = sum(r["requests"] for r in requests.values())
+    failed = sum(r["errors"] for r in requests.values())
+
+    return {
+        "url": opts.url,
+        "mode": "polling" if opts.polling else "sse",
+        "clients": {k: getattr(opts, k) for k in ("live", "overview", "analytics", "nodes")},
+        "duration_s": round(wall, 1),
+        "total": {
+            "requests": total,
+            "rps": round(total / wall, 1),
+            "errors": failed,
+            "error_rate": round(failed / total, 4) if total else 0.0,
+        },
+        "requests": requests,
+        "sse": {
+            "streams": streams,
+            "events": events,
+            "events_per_s": round(sum(events.values()) / wall, 1),
+            "sample_age_p50_s": round(percentile(ages, 50), 3) if ages else None,
+            "sample_age_p99_s": round(percentile(ages, 99), 3) if ages else None,
+        },
+        "server": server_summary(before, after, wall / 60),
+    }
+
+
+def print_summary(result):
+    out = sys.stderr
+    t = result["total"]
+    print(f"\n{result['mode']} - {result['clients']} - {result['duration_s']} s", file=out)
+    print(f"{t['requests']} requests, {t['rps']} req/s, {t['errors']} errors "
+          f"({t['error_rate'] * 100:.2f} %)", file=out)
+    print(f"{'kind':<18}{'n':>8}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}", file=out)
+    for kind, r in result["requests"].items():
+        print(f"{kind:<18}{r['requests']:>8}{r['errors']:>6}{r['rps']:>9}"
+              f"{r['p50_ms'] or '-':>10}{r['p99_ms'] or '-':>10}{r['max_ms'] or '-':>10}", file=out)
+    print(f"sse: {result['sse']}", file=out)
+    print(f"server: {result['server']}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aerium dashboard load test")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--live", type=int, default=10, help="/live pages")
+    parser.add_argument("--overview", type=int, default=10, help="/ pages")
+    parser.add_argument("--analytics", type=int, default=2, help="/analytics pages")
+    parser.add_argument("--nodes", type=int, default=0, help="sensor nodes posting readings")
+    parser.add_argument("--sensor", default="default", help="sensor the dashboards follow")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds to start every client")
+    parser.add_argument("--polling", action="store_true", help="former polling frontend instead of SSE")
+    parser.add_argument("--poll-delay", type=float, default=1.0, help="pollingDelay of the live page, s")
+    parser.add_argument("--think", type=float, default=15, help="analytics range switch, s")
+    parser.add_argument("--node-interval", type=float, default=10, help="s between node batches")
+    parser.add_argument("--out", help="also write the JSON result here")
+    opts = parser.parse_args()
+    opts.url = opts.url.rstrip("/")
+
+    rec = Recorder()
+    stop = threading.Event()
+    sockets = set()
+
+    clients = []
+    for page, n in (("/live", opts.live), ("/", opts.overview)):
+        for _ in range(n):
+            if opts.polling:
+                clients.append((polling_client, (opts.url, rec, stop, page, opts.sensor, opts.poll_delay)))
+            else:
+                clients.append((sse_client, (opts.url, rec, stop, page, opts.sensor, sockets)))
+    clients += [(analytics_client, (opts.url, rec, stop, opts.sensor, opts.think))] * opts.analytics
+    clients += [(node_client, (opts.url, rec, stop, i, opts.node_interval)) for i in range(opts.nodes)]
+    if not clients:
+        parser.error("no clients")
+    random.shuffle(clients)
+
+    before = scrape(opts.url)
+    start = time.perf_counter()
+    threads = []
+    for i, (target, args) in enumerate(clients):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        threads.append(thread)
+        wait(stop, start + opts.ramp * (i + 1) / len(clients) - time.perf_counter())
+    print(f"[loadtest] {len(clients)} clients running", file=sys.stderr)
+
+    wait(stop, start + opts.duration - time.perf_counter())
+    stop.set()
+    wall = time.perf_counter() - start
+
+    # unblock streams waiting for their next event
+    with rec.lock:
+        for sock in list(sockets):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+    result = report(rec, wall, opts, before, scrape(opts.url))
+    print_summary(result)
+    print(json.dumps(result, indent=2))
+    if opts.out:
+        with open(opts.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
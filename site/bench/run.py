@@ -0,0 +1,271 @@
+# bench/run.py
+# Benchmark suite: for each database size (1 Hz readings, ending now) a
+# fresh interpreter seeds a temporary database, then measures ingest
+# throughput, HTTP latency of the history / latest / stats routes under
+# concurrency, daily PDF rendering and peak memory. Results go to one
+# JSON file per run; compare two runs with bench/compare.py.
+#
+#   python bench/run.py                       # 1d, 30d and 1y
+#   python bench/run.py --sizes 1d,30d --concurrency 16 --out before.json
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+SITE = os.path.dirname(BENCH)
+
+SIZES = {"1d": 1, "30d": 30, "1y": 365}
+
+# name -> path; {hour_ago} and {now} are filled in at run time
+ENDPOINTS = [
+    ("latest", "/api/latest"),
+    ("history_today", "/api/history/today"),
+    ("history_today_raw", "/api/history/today?resolution=raw"),
+    ("history_today_points", "/api/history/today?points=500"),
+    ("history_7d", "/api/history/7d"),
+    ("history_30d", "/api/history/30d"),
+    ("history_30d_points", "/api/history/30d?points=800"),
+    ("history_last_hour", "/api/history?from={hour_ago}&to={now}"),
+    ("history_latest_1000", "/api/history/latest/1000"),
+    ("stats_today", "/api/stats?range=today"),
+]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def db_mb(path):
+    # recent pages may still sit in the WAL file
+    size = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+    return round(size / 2**20, 1)
+
+
+def percentile(sorted_values, p):
+    # nearest rank
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def latency_summary(samples, errors, wall):
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "requests": len(samples) + errors,
+        "errors": errors,
+        "rps": round((len(samples) + errors) / wall, 1) if wall else None,
+        "p50_ms": round(percentile(ms, 50), 2) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 2) if ms else None,
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else None,
+        "max_ms": round(ms[-1], 2) if ms else None,
+    }
+
+
+def hammer(url, requests, concurrency, warmup=3):
+    def one(_):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=120) as resp:
+                resp.read()
+            return time.perf_counter() - start
+        except Exception:
+            return None
+
+    for _ in range(warmup):
+        one(None)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+
+    samples = [r for r in results if r is not None]
+    return latency_summary(samples, len(results) - len(samples), wall)
+
+
+def bench_ingest(writes):
+    from fake_co2 import save_reading
+    from ingest import get_writer
+
+    ts = int(time.time()) + 86400  # past the seeded data, own sensor
+    writer = get_writer()
+    before = writer.stats()["written"]
+
+    start = time.perf_counter()
+    for i in range(writes):
+        save_reading(400 + i % 1000, ts + i, "bench-writer")
+    queued = time.perf_counter() - start
+    writer.flush()
+    total = time.perf_counter() - start
+
+    return {
+        "writes": writes,
+        "save_reading_per_s": round(writes / queued),
+        "committed_per_s": round(writes / total),
+        "committed": writer.stats()["written"] - before,
+    }
+
+
+def bench_pdf(flask_app, runs):
+    import app
+
+    day = (datetime.now(timezone.utc) - timedelta(days=1)).date()
+    with flask_app.app_context():
+        key, persistent, build_html = app.daily_report(day)
+
+        html_times, render_times = [], []
+        try:
+            for _ in range(runs):
+                start = time.perf_counter()
+                html = build_html()
+                html_times.append(time.perf_counter() - start)
+                if html is None:
+                    return {"error": "no data for " + day.isoformat()}
+
+                start = time.perf_counter()
+                pdf = app.render_pdf(html)
+                render_times.append(time.perf_counter() - start)
+        except Exception as e:
+            # WeasyPrint or its system libraries may be missing
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    return {
+        "date": day.isoformat(),
+        "runs": runs,
+        "build_html_ms": round(statistics.median(html_times) * 1000, 1),
+        "render_ms": round(statistics.median(render_times) * 1000, 1),
+        "pdf_bytes": len(pdf),
+    }
+
+
+def measure(size, opts):
+    """Runs in the child interpreter, AERIUM_DB already set."""
+    import backfill
+    from database import DEFAULT_SENSOR
+
+    result = {"size": size, "peak_rss_mb": {}}
+
+    start = time.perf_counter()
+    rows = backfill.backfill([DEFAULT_SENSOR], SIZES[size])
+    result["seed"] = {"rows": rows, "seconds": round(time.perf_counter() - start, 1)}
+    result["db_mb"] = db_mb(os.environ["AERIUM_DB"])
+    result["peak_rss_mb"]["seed"] = peak_rss_mb()
+
+    import logging
+    import app
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no per-request log
+
+    app.REPORT_CACHE_DIR = os.path.join(os.path.dirname(os.environ["AERIUM_DB"]), "reports")
+    flask_app = app.create_app(acquire=False)
+
+    result["ingest"] = bench_ingest(opts.writes)
+    result["peak_rss_mb"]["ingest"] = peak_rss_mb()
+
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    now = int(time.time())
+    result["http"] = {"concurrency": opts.concurrency}
+    for name, path in ENDPOINTS:
+        url = base + path.format(now=now, hour_ago=now - 3600)
+        result["http"][name] = hammer(url, opts.requests, opts.concurrency)
+    result["peak_rss_mb"]["http"] = peak_rss_mb()
+
+    result["pdf"] = bench_pdf(flask_app, opts.pdf_runs)
+    result["peak_rss_mb"]["pdf"] = peak_rss_mb()
+
+    server.shutdown()
+    return result
+
+
+def run_child(size, opts):
+    with tempfile.TemporaryDirectory(prefix=f"aerium-bench-{size}-") as tmp:
+        env = dict(
+            os.environ,
+            AERIUM_DB=os.path.join(tmp, "bench.sqlite"),
+            PYTHONPATH=os.pathsep.join([SITE, os.environ.get("PYTHONPATH", "")]),
+        )
+        cmd = [
+            sys.executable, os.path.abspath(__file__), "--child", size,
+            "--requests", str(opts.requests),
+            "--concurrency", str(opts.concurrency),
+            "--writes", str(opts.writes),
+            "--pdf-runs", str(opts.pdf_runs),
+        ]
+        # the child logs to stderr; its last stdout line is the result
+        out = subprocess.run(cmd, cwd=SITE, env=env, stdout=subprocess.PIPE, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SITE,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=SITE,
+            capture_output=True, text=True,
+        ).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aerium benchmark suite")
+    parser.add_argument("--sizes", default="1d,30d,1y")
+    parser.add_argument("--requests", type=int, default=200, help="per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=50_000)
+    parser.add_argument("--pdf-runs", type=int, default=3)
+    parser.add_argument("--out", help="result file (default bench/results/<commit>.json)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+
+    if opts.child:
+        print(json.dumps(measure(opts.child, opts)))
+        return
+
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPU",
+        "options": {k: getattr(opts, k) for k in ("requests", "concurrency", "writes", "pdf_runs")},
+        "results": {},
+    }
+
+    for size in opts.sizes.split(","):
+        if size not in SIZES:
+            parser.error(f"unknown size {size} (choose from {', '.join(SIZES)})")
+        print(f"[bench] {size}...", file=sys.stderr)
+        report["results"][size] = run_child(size, opts)
+
+    out = opts.out or os.path.join(BENCH, "results", f"{commit or 'unknown'}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] results written to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
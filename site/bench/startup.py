@@ -0,0 +1,51 @@
+# bench/startup.py
+# Cold-start latency: time `import app` and `create_app()` in fresh
+# interpreters (nothing cached in-process), report the median.
+#
+#   python bench/startup.py [runs]
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SITE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.create_app(acquire=False)
+t2 = time.perf_counter()
+import sys
+print(t1 - t0, t2 - t1, "weasyprint" in sys.modules)
+"""
+
+
+def run_once(db_path):
+    env = dict(os.environ, AERIUM_DB=db_path)
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=SITE, env=env, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    return float(out[-3]), float(out[-2]), out[-1] == "True"
+
+
+def main(runs=10):
+    with tempfile.TemporaryDirectory() as tmp:
+        samples = [run_once(os.path.join(tmp, "bench.sqlite")) for _ in range(runs)]
+
+    result = {
+        "runs": runs,
+        "import_ms_median": round(statistics.median(s[0] for s in samples) * 1000, 1),
+        "create_app_ms_median": round(statistics.median(s[1] for s in samples) * 1000, 1),
+        "weasyprint_loaded": any(s[2] for s in samples),
+    }
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
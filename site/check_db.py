@@ -12,9 +12,9 @@ print(cur.fetchall())
 
 print("\nLast 20 readings:")
 cur.execute("""
-    SELECT id, ppm, timestamp
+    SELECT sensor_id, ts, ppm, datetime(ts, 'unixepoch')
     FROM co2_readings
-    ORDER BY timestamp DESC
+    ORDER BY ts DESC
     LIMIT 20
 """)
 for row in cur.fetchall():
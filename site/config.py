@@ -0,0 +1,101 @@
+# config.py
+import json
+import os
+import threading
+import time
+from database import get_db
+
+DEFAULT_SETTINGS = {
+    "analysis_running": True,
+    "good_threshold": 800,
+    "bad_threshold": 1200,
+    "alert_threshold": 1400,
+    "realistic_mode": True,
+    "update_speed": 1,
+}
+
+# Settings change a few times a day but are read on every sample and
+# request: keep them in memory, bump the version on every write.
+_cache = None
+_version = 0
+_lock = threading.Lock()
+
+# distinguishes ETags of this process from those of a previous run
+_BOOT = f"{os.getpid():x}{int(time.time()):x}"
+
+# multi-process mode (serve.py): the version lives in shared memory and a
+# write in any process invalidates every process' cache
+_shared = None
+_shared_seen = 0
+
+def use_shared_state(state, boot):
+    global _shared, _shared_seen, _BOOT
+    _shared = state
+    _shared_seen = state.settings_version()
+    _BOOT = boot
+    invalidate_settings(local=True)
+
+def _read_settings():
+    with get_db() as db:
+        rows = db.execute("SELECT key, value FROM settings").fetchall()
+
+    settings = DEFAULT_SETTINGS.copy()
+    for r in rows:
+        settings[r["key"]] = json.loads(r["value"])
+
+    return settings
+
+def load_settings():
+    global _cache, _shared_seen
+
+    if _shared is not None:
+        version = _shared.settings_version()
+        if version != _shared_seen:
+            _shared_seen = version
+            invalidate_settings(local=True)
+
+    cached = _cache
+    if cached is None:
+        version = _version
+        cached = _read_settings()
+        with _lock:
+            # a write that raced with this read wins
+            if version == _version:
+                _cache = cached
+
+    return cached.copy()
+
+def thresholds(settings):
+    """(good, bad, alert) in increasing order. The settings page moves good
+    and bad only: an alert threshold left below bad is raised to it."""
+    good = settings["good_threshold"]
+    bad = max(settings["bad_threshold"], good)
+    return good, bad, max(settings["alert_threshold"], bad)
+
+def invalidate_settings(local=False):
+    global _cache, _version, _shared_seen
+    with _lock:
+        _cache = None
+        _version += 1
+        if _shared is not None and not local:
+            _shared_seen = _shared.bump_settings_version()
+
+def settings_version():
+    return _shared.settings_version() if _shared is not None else _version
+
+def settings_etag():
+    return f"{_BOOT}-{settings_version()}"
+
+def save_settings(data):
+    with get_db() as db:
+        for k, v in data.items():
+            db.execute(
+                "REPLACE INTO settings (key, value) VALUES (?, ?)",
+                (k, json.dumps(v))
+            )
+    invalidate_settings()
+
+def reset_settings():
+    with get_db() as db:
+        db.execute("DELETE FROM settings")
+    invalidate_settings()
@@ -1,34 +1,492 @@
+import os
+import queue
 import sqlite3
+import threading
+import time
 from pathlib import Path
 
-DB_PATH = Path("data/aerium.sqlite")
+import metrics
 
-def get_db():
-    DB_PATH.parent.mkdir(exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+DB_PATH = Path(os.environ.get("AERIUM_DB", "data/aerium.sqlite"))
+
+# Connection pool tuning (overridable from the environment)
+POOL_SIZE = int(os.environ.get("AERIUM_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("AERIUM_DB_POOL_TIMEOUT", "10"))
+CACHE_SIZE_KB = int(os.environ.get("AERIUM_DB_CACHE_KB", "16384"))
+MMAP_SIZE = int(os.environ.get("AERIUM_DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+BUSY_TIMEOUT_MS = 5000
+
+# readings recorded before sensors existed belong to this one
+DEFAULT_SENSOR = "default"
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row
+
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
     return conn
 
-def init_db():
-    db = get_db()
-    cur = db.cursor()
-
-    # CO₂ history
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS co2_readings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+
+class PooledConnection:
+    """Proxy around a pooled sqlite3 connection; close() hands it back.
+    Use it as `with get_db() as db:` so an exception cannot leak it.
+
+    Statements are timed for /metrics. A SELECT does most of its work while
+    its rows are read, so a statement's time runs until the next statement
+    on the connection or its release, not just until execute() returns.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._statement = None  # (sql, start) being timed
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def _begin(self, sql):
+        now = time.perf_counter()
+        self._end(now)
+        self._statement = (sql, now)
+
+    def _end(self, now=None):
+        if self._statement is not None:
+            sql, start = self._statement
+            self._statement = None
+            metrics.record_statement(sql, (now or time.perf_counter()) - start)
+
+    def _run(self, sql, fn, *args):
+        self._begin(sql)
+        try:
+            return fn(*args)
+        except sqlite3.OperationalError as e:
+            metrics.record_sql_error(e)
+            raise
+
+    def execute(self, sql, params=()):
+        return self._run(sql, self._conn.execute, sql, params)
+
+    def executemany(self, sql, rows):
+        return self._run(sql, self._conn.executemany, sql, rows)
+
+    def executescript(self, script):
+        return self._run(script, self._conn.executescript, script)
+
+    def cursor(self):
+        return TimedCursor(self, self._conn.cursor())
+
+    def commit(self):
+        self._run("COMMIT", self._conn.commit)
+        self._end()
+
+    def rollback(self):
+        self._run("ROLLBACK", self._conn.rollback)
+        self._end()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # `with get_db() as db:` commits (rolls back on error) and always
+        # hands the connection back, whatever was raised
+        try:
+            if self._conn is not None and self._conn.in_transaction:
+                if exc_type is None:
+                    self.commit()
+                else:
+                    self.rollback()
+        finally:
+            self.close()
+        return False
+
+    def close(self):
+        if self._conn is not None:
+            self._end()
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+class TimedCursor:
+    """Cursor of a PooledConnection whose statements are timed the same way.
+    Iterating goes straight to the sqlite3 cursor."""
+
+    def __init__(self, conn, cursor):
+        self.__dict__["_conn"] = conn
+        self.__dict__["_cursor"] = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, sql, params=()):
+        self._conn._run(sql, self._cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql, rows):
+        self._conn._run(sql, self._cursor.executemany, sql, rows)
+        return self
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = Path(path)
+        self.size = size
+        self.timeout = timeout
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def acquire(self):
+        start = time.perf_counter()
+        blocked = False
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._opened < self.size:
+                    self._opened += 1
+                    opening = True
+                else:
+                    opening = False
+
+            if opening:
+                try:
+                    conn = _connect(self.path)
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                blocked = True
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    metrics.pool_timeouts.inc()
+                    raise TimeoutError(
+                        f"no database connection available after {self.timeout}s"
+                    )
+
+        waited = time.perf_counter() - start
+        metrics.pool_wait.observe(waited)
+        with self._lock:
+            self._checkouts += 1
+            if blocked:
+                self._waits += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        # never hand a half-finished transaction to the next borrower
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            # unusable: drop it, the slot opens a new one on demand
+            print(f"[db] discarding pooled connection: {e}")
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._opened -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._opened,
+                "idle": self._idle.qsize(),
+                "in_use": self._opened - self._idle.qsize(),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_total_ms": round(self._wait_total * 1000, 3),
+                "wait_avg_ms": round(self._wait_total * 1000 / self._waits, 3)
+                if self._waits else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def get_db():
+    return get_pool().acquire()
+
+def _migrate_epoch_ts(db):
+    # v1: integer epoch-second key, clustered on time (WITHOUT ROWID), so a
+    # range query is a single B-tree seek + sequential read
+    db.execute("""
+        CREATE TABLE co2_readings_v1 (
+            ts INTEGER PRIMARY KEY,
+            ppm INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+    legacy = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'co2_readings'"
+    ).fetchone()
+
+    if legacy:
+        # one row per second: readings sharing a second (several tabs used
+        # to save the same sample) are averaged, not silently dropped
+        total = db.execute("SELECT COUNT(*) FROM co2_readings").fetchone()[0]
+        db.execute("""
+            INSERT INTO co2_readings_v1 (ts, ppm)
+            SELECT CAST(strftime('%s', timestamp) AS INTEGER) AS second,
+                   CAST(ROUND(AVG(ppm)) AS INTEGER)
+            FROM co2_readings
+            WHERE strftime('%s', timestamp) IS NOT NULL
+            GROUP BY second
+        """)
+        kept = db.execute("SELECT COUNT(*) FROM co2_readings_v1").fetchone()[0]
+        if kept < total:
+            print(
+                f"[db] v1: {total} legacy readings stored as {kept} rows "
+                "(same-second readings averaged, invalid timestamps skipped)"
+            )
+        db.execute("DROP TABLE co2_readings")
+
+    db.execute("ALTER TABLE co2_readings_v1 RENAME TO co2_readings")
+
+
+def _migrate_rollups(db):
+    # v2: per-bucket aggregates maintained by rollups.py
+    for name in ("minute", "hour", "day"):
+        db.execute(f"""
+            CREATE TABLE co2_rollup_{name} (
+                bucket INTEGER PRIMARY KEY,
+                n INTEGER NOT NULL,
+                sum INTEGER NOT NULL,
+                min INTEGER NOT NULL,
+                max INTEGER NOT NULL,
+                n_over_good INTEGER NOT NULL,
+                n_over_bad INTEGER NOT NULL,
+                n_over_alert INTEGER NOT NULL
+            )
+        """)
+
+
+def _migrate_sensors(db):
+    # v3: one server, many rooms. Readings and rollups are keyed by
+    # (sensor_id, time) so one room's range query stays a single seek
+    # however many other rooms share the table.
+    db.execute("""
+        CREATE TABLE sensors (
+            sensor_id TEXT PRIMARY KEY,
+            room TEXT,
+            created_at INTEGER NOT NULL
+        )
+    """)
+    db.execute(
+        "INSERT INTO sensors (sensor_id, created_at) VALUES (?, CAST(strftime('%s', 'now') AS INTEGER))",
+        (DEFAULT_SENSOR,)
+    )
+
+    db.execute("""
+        CREATE TABLE co2_readings_v3 (
+            sensor_id TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            ppm INTEGER NOT NULL,
+            PRIMARY KEY (sensor_id, ts)
+        ) WITHOUT ROWID
+    """)
+    db.execute(
+        "INSERT INTO co2_readings_v3 SELECT ?, ts, ppm FROM co2_readings",
+        (DEFAULT_SENSOR,)
+    )
+    db.execute("DROP TABLE co2_readings")
+    db.execute("ALTER TABLE co2_readings_v3 RENAME TO co2_readings")
+
+    for name in ("minute", "hour", "day"):
+        db.execute(f"""
+            CREATE TABLE co2_rollup_{name}_v3 (
+                sensor_id TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                n INTEGER NOT NULL,
+                sum INTEGER NOT NULL,
+                min INTEGER NOT NULL,
+                max INTEGER NOT NULL,
+                n_over_good INTEGER NOT NULL,
+                n_over_bad INTEGER NOT NULL,
+                n_over_alert INTEGER NOT NULL,
+                PRIMARY KEY (sensor_id, bucket)
+            ) WITHOUT ROWID
+        """)
+        db.execute(
+            f"INSERT INTO co2_rollup_{name}_v3 SELECT ?, * FROM co2_rollup_{name}",
+            (DEFAULT_SENSOR,)
+        )
+        db.execute(f"DROP TABLE co2_rollup_{name}")
+        db.execute(f"ALTER TABLE co2_rollup_{name}_v3 RENAME TO co2_rollup_{name}")
+
+
+def _migrate_ingest_nodes(db):
+    # v4: last batch sequence number accepted from each remote node, so a
+    # retried POST /api/readings is recognised and skipped
+    db.execute("""
+        CREATE TABLE ingest_nodes (
+            node_id TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    """)
+
+
+def _migrate_alerts(db):
+    # v5: alert level changes found by alerts.py, and the per-sensor state
+    # machine they come from
+    db.execute("""
+        CREATE TABLE alert_events (
+            id INTEGER PRIMARY KEY,
+            sensor_id TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            level TEXT NOT NULL,
+            previous TEXT NOT NULL,
             ppm INTEGER NOT NULL
         )
     """)
+    db.execute("CREATE INDEX idx_alert_events_sensor_ts ON alert_events (sensor_id, ts)")
+    db.execute("""
+        CREATE TABLE alert_state (
+            sensor_id TEXT PRIMARY KEY,
+            level INTEGER NOT NULL,
+            candidate INTEGER,
+            since INTEGER,
+            last_ts INTEGER NOT NULL
+        )
+    """)
+
 
-    # Settings persistence
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS settings (
-            key TEXT PRIMARY KEY,
-            value TEXT NOT NULL
+def _migrate_drop_threshold_counts(db):
+    # v6: the n_over_* counters were never read and depended on the
+    # thresholds, so every threshold change rebuilt all rollups
+    for name in ("minute", "hour", "day"):
+        db.execute(f"""
+            CREATE TABLE co2_rollup_{name}_v6 (
+                sensor_id TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                n INTEGER NOT NULL,
+                sum INTEGER NOT NULL,
+                min INTEGER NOT NULL,
+                max INTEGER NOT NULL,
+                PRIMARY KEY (sensor_id, bucket)
+            ) WITHOUT ROWID
+        """)
+        db.execute(f"""
+            INSERT INTO co2_rollup_{name}_v6
+            SELECT sensor_id, bucket, n, sum, min, max FROM co2_rollup_{name}
+        """)
+        db.execute(f"DROP TABLE co2_rollup_{name}")
+        db.execute(f"ALTER TABLE co2_rollup_{name}_v6 RENAME TO co2_rollup_{name}")
+
+
+def _migrate_rollup_exposure(db):
+    # v7: readings and seconds at or above each threshold per bucket, so
+    # exposure over long ranges comes from the rollups; rollup_state
+    # records the thresholds they were computed with (filled by rollups.py)
+    for name in ("minute", "hour", "day"):
+        for column in ("n_over_good", "n_over_bad", "n_over_alert",
+                       "secs", "s_over_good", "s_over_bad", "s_over_alert"):
+            db.execute(f"ALTER TABLE co2_rollup_{name} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+    db.execute("""
+        CREATE TABLE rollup_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            good NUMERIC NOT NULL,
+            bad NUMERIC NOT NULL,
+            alert NUMERIC NOT NULL,
+            complete INTEGER NOT NULL
         )
     """)
 
-    db.commit()
-    db.close()
+
+# applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    _migrate_epoch_ts,
+    _migrate_rollups,
+    _migrate_sensors,
+    _migrate_ingest_nodes,
+    _migrate_alerts,
+    _migrate_drop_threshold_counts,
+    _migrate_rollup_exposure,
+]
+
+
+def init_db():
+    with get_db() as db:
+        cur = db.cursor()
+
+        # Settings persistence
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        db.commit()
+
+        # CO₂ history (schema managed by MIGRATIONS)
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        for i, migrate in enumerate(MIGRATIONS[version:], start=version + 1):
+            # explicit BEGIN: the sqlite3 module would autocommit the DDL
+            db.execute("BEGIN")
+            try:
+                migrate(db)
+                db.execute(f"PRAGMA user_version = {i}")
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            print(f"[db] migrated schema to v{i} ({migrate.__name__})")
@@ -0,0 +1,53 @@
+# downsample.py
+# Largest-Triangle-Three-Buckets: keeps the points that matter visually
+# (peaks, dips, turns) when a series has far more points than pixels.
+
+
+def lttb(xs, ys, threshold):
+    """Return the indices of the points kept by LTTB (first/last always kept).
+
+    Single streaming pass over the series: O(n) time, O(threshold) memory.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+
+    for i in range(threshold - 2):
+        # average of the next bucket: the third triangle vertex
+        nxt_start = int((i + 1) * every) + 1
+        nxt_end = min(int((i + 2) * every) + 1, n)
+        count = nxt_end - nxt_start
+        avg_x = sum(xs[nxt_start:nxt_end]) / count
+        avg_y = sum(ys[nxt_start:nxt_end]) / count
+
+        # pick the point of this bucket with the largest triangle area
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        dx, dy = ax - avg_x, avg_y - ay
+
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs(dx * (ys[j] - ay) - (ax - xs[j]) * dy)
+            if area > best_area:
+                best, best_area = j, area
+
+        kept.append(best)
+        a = best
+
+    kept.append(n - 1)
+    return kept
+
+
+def downsample(rows, points, x="ts", y="ppm"):
+    """LTTB over a list of row dicts."""
+    if points >= len(rows):
+        return rows
+
+    xs = [r[x] for r in rows]
+    ys = [r[y] for r in rows]
+    return [rows[i] for i in lttb(xs, ys, points)]
@@ -0,0 +1,75 @@
+# export.py
+# Streaming export of one sensor's raw readings (GET /api/export): CSV or
+# NDJSON lines built by SQLite, read in keyset chunks and optionally
+# gzip-compressed on the fly. Memory stays at one chunk whatever the range.
+#
+#   csv     timestamp,ppm            (UTC, the header the importers expect)
+#   ndjson  {"ppm":612,"timestamp":"...","ts":1760000000}
+#
+# Each chunk is a seek on (sensor_id, ts) with its own pooled connection,
+# so a slow download does not keep a connection (or a WAL snapshot) busy.
+import zlib
+
+from database import get_db
+
+# rows read per statement
+CHUNK_ROWS = 5000
+
+# CSV of readings: level 1 is ~5.5x at 100 MB/s, level 6 ~6.3x at 23 MB/s
+GZIP_LEVEL = 1
+
+FORMATS = {
+    "csv": {
+        "mimetype": "text/csv",
+        "header": b"timestamp,ppm\n",
+        "line": "datetime(ts, 'unixepoch') || ',' || ppm",
+    },
+    "ndjson": {
+        "mimetype": "application/x-ndjson",
+        "header": b"",
+        # key order of jsonify (sorted), like the history routes
+        "line": "json_object('ppm', ppm, 'timestamp', datetime(ts, 'unixepoch'), 'ts', ts)",
+    },
+}
+
+
+def export_lines(sensor_id, start, end, fmt):
+    """Byte chunks of the export of [start, end), one per CHUNK_ROWS rows."""
+    # SQLite joins the lines of a chunk: one string per statement, no
+    # Python object per row
+    sql = f"""
+        SELECT max(ts), group_concat(line, char(10))
+        FROM (
+            SELECT ts, {FORMATS[fmt]["line"]} AS line
+            FROM co2_readings
+            WHERE sensor_id = ? AND ts >= ? AND ts < ?
+            ORDER BY ts
+            LIMIT ?
+        )
+    """
+    header = FORMATS[fmt]["header"]
+    if header:
+        yield header
+
+    lo = start
+    while lo < end:
+        db = get_db()
+        try:
+            last, lines = db.execute(sql, (sensor_id, lo, end, CHUNK_ROWS)).fetchone()
+        finally:
+            db.close()
+        if last is None:
+            return
+
+        yield (lines + "\n").encode()
+        lo = last + 1
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """gzip stream of chunks, yielding compressed data as it fills."""
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = z.compress(chunk)
+        if data:
+            yield data
+    yield z.flush()
@@ -1,6 +1,8 @@
 # fake_co2.py
 import random
-from database import get_db
+import time
+from database import DEFAULT_SENSOR
+from ingest import get_writer
 
 def generate_co2(realistic=True, base=500):
     if realistic:
@@ -11,11 +13,6 @@ def generate_co2(realistic=True, base=500):
 
     return int(max(400, min(2000, value)))
 
-def save_reading(ppm: int):
-    db = get_db()
-    db.execute(
-        "INSERT INTO co2_readings (ppm) VALUES (?)",
-        (ppm,)
-    )
-    db.commit()
-    db.close()
+def save_reading(ppm: int, ts=None, sensor_id=DEFAULT_SENSOR):
+    # queued: the ingest writer commits readings in batches
+    get_writer().put(int(ts if ts is not None else time.time()), ppm, sensor_id)
@@ -0,0 +1,229 @@
+# history.py
+# Time-range helpers for co2_readings (ts = integer epoch seconds, UTC).
+# Every query is for one sensor; the (sensor_id, ts) key makes it a range seek.
+import json
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+import rollups
+from database import DEFAULT_SENSOR, get_db
+
+DAY = 86400
+
+# auto resolution: finest level that keeps a response under this many rows
+MAX_POINTS = 1500
+
+RESOLUTIONS = ["raw"] + [name for name, _, _ in rollups.LEVELS]
+
+# named ranges used by the dashboard, as seconds back from now
+NAMED_RANGES = {
+    "7d": 7 * DAY,
+    "30d": 30 * DAY,
+}
+
+
+# accepted epoch seconds: keeps bounds inside SQLite integers and the
+# (ts - start) << 16 packing of analysis.py
+MIN_TS = 0
+MAX_TS = 2**40
+
+
+def parse_time(value):
+    """Accept epoch seconds or an ISO 8601 string (naive = UTC); raises
+    ValueError outside MIN_TS..MAX_TS."""
+    try:
+        ts = int(float(value))
+    except OverflowError:
+        raise ValueError("Time out of range")
+    except ValueError:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        ts = int(dt.timestamp())
+
+    if not MIN_TS <= ts <= MAX_TS:
+        raise ValueError("Time out of range")
+    return ts
+
+
+def range_bounds(name, now=None):
+    """Return [start, end) epoch bounds for a named range, or None."""
+    now = int(now if now is not None else time.time())
+    end = now + 1
+
+    if name == "today":
+        return now - now % DAY, end
+
+    if name in NAMED_RANGES:
+        return now - NAMED_RANGES[name], end
+
+    return None
+
+
+def bounds_from_args(args, default_span=DAY):
+    """[start, end) from ?range= or ?from=&to= query args; raises ValueError."""
+    if "range" in args:
+        bounds = range_bounds(args["range"])
+        if bounds is None:
+            raise ValueError("Invalid range")
+        return bounds
+
+    end = parse_time(args["to"]) if "to" in args else int(time.time()) + 1
+    start = parse_time(args["from"]) if "from" in args else end - default_span
+
+    if start >= end:
+        raise ValueError("Empty range")
+
+    return start, end
+
+
+def fetch_readings(start, end, sensor_id=DEFAULT_SENSOR):
+    with get_db() as db:
+        rows = db.execute("""
+            SELECT ts, ppm, datetime(ts, 'unixepoch') AS timestamp
+            FROM co2_readings
+            WHERE sensor_id = ? AND ts >= ? AND ts < ?
+            ORDER BY ts
+        """, (sensor_id, start, end)).fetchall()
+
+    return [dict(r) for r in rows]
+
+
+# keyset pages: rows per request by default, and at most
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+def fetch_page(sensor_id=DEFAULT_SENSOR, after=None, before=None, limit=PAGE_SIZE):
+    """Up to `limit` readings with after < ts < before, oldest first, and
+    whether more rows lie beyond the page. With `after` the page starts
+    right after it (paging forward), otherwise it ends at the newest row
+    before `before` (paging back). An index seek plus `limit` rows, however
+    deep the cursor."""
+    where = "sensor_id = ?"
+    params = [sensor_id]
+    if after is not None:
+        where += " AND ts > ?"
+        params.append(after)
+    if before is not None:
+        where += " AND ts < ?"
+        params.append(before)
+    order = "ts" if after is not None else "ts DESC"
+
+    with get_db() as db:
+        rows = db.execute(f"""
+            SELECT ts, ppm, datetime(ts, 'unixepoch') AS timestamp
+            FROM co2_readings
+            WHERE {where}
+            ORDER BY {order}
+            LIMIT ?
+        """, params + [limit + 1]).fetchall()
+
+    more = len(rows) > limit
+    rows = [dict(r) for r in rows[:limit]]
+    if after is None:
+        rows.reverse()
+    return rows, more
+
+
+def pick_resolution(start, end, max_points=MAX_POINTS, sensor_id=DEFAULT_SENSOR):
+    if rollups.count_readings(start, end, sensor_id) <= max_points:
+        return "raw"
+
+    for name, size, _ in rollups.LEVELS:
+        if (end - start) / size <= max_points:
+            return name
+
+    return rollups.LEVELS[-1][0]
+
+
+def fetch_series(start, end, resolution="auto", max_points=MAX_POINTS,
+                 sensor_id=DEFAULT_SENSOR):
+    """One sensor's readings in [start, end) at the requested (or auto) resolution."""
+    if resolution == "auto":
+        resolution = pick_resolution(start, end, max_points, sensor_id)
+
+    if resolution == "raw":
+        return fetch_readings(start, end, sensor_id)
+
+    return rollups.fetch(resolution, start, end, sensor_id)
+
+
+def data_version(start, end, sensor_id=DEFAULT_SENSOR):
+    """Changes whenever readings in [start, end) are added (cache keys)."""
+    with get_db() as db:
+        n, last = db.execute("""
+            SELECT COUNT(*), MAX(ts)
+            FROM co2_readings
+            WHERE sensor_id = ? AND ts >= ? AND ts < ?
+        """, (sensor_id, start, end)).fetchone()
+    return f"{n}.{last}"
+
+
+def columns(rows):
+    """Columnar form of history rows (?format=columnar): t0, the ts deltas
+    (dt[0] = 0) and one array per value field. The timestamp strings are
+    dropped: ts = t0 + dt[0] + ... + dt[i]."""
+    ts = [r["ts"] for r in rows]
+    out = {
+        "t0": ts[0] if ts else None,
+        "dt": [b - a for a, b in zip(ts[:1] + ts, ts)],
+    }
+    fields = [k for k in rows[0] if k not in ("ts", "timestamp")] if rows else ["ppm"]
+    for k in fields:
+        out[k] = [r[k] for r in rows]
+    return out
+
+
+# approximate memory of one cached row besides its JSON: dict, values, refs
+ROW_OVERHEAD = 400
+
+
+class RowSet:
+    """History rows with their ts and JSON encoding side by side, so a
+    cached range is sliced by bisect and answered without re-serializing."""
+
+    __slots__ = ("ts", "rows", "parts")
+
+    def __init__(self, ts, rows, parts):
+        self.ts = ts
+        self.rows = rows
+        self.parts = parts
+
+    def json(self):
+        # byte for byte what jsonify(rows) returns
+        return b"[" + b",".join(self.parts) + b"]\n"
+
+
+class Rows:
+    """range_cache kind for one resolution (raw readings or a rollup level)."""
+
+    def __init__(self, resolution):
+        self.resolution = resolution
+        self.step = 1 if resolution == "raw" else next(
+            size for name, size, _ in rollups.LEVELS if name == resolution
+        )
+
+    def load(self, sensor_id, start, end):
+        if self.resolution == "raw":
+            rows = fetch_readings(start, end, sensor_id)
+        else:
+            rows = rollups.fetch(self.resolution, start, end, sensor_id)
+        # same encoding as jsonify()
+        parts = [json.dumps(r, sort_keys=True, separators=(",", ":")).encode() for r in rows]
+        return RowSet([r["ts"] for r in rows], rows, parts)
+
+    def slice(self, data, lo, hi):
+        i, j = bisect_left(data.ts, lo), bisect_left(data.ts, hi)
+        if i == 0 and j == len(data.ts):
+            return data
+        return RowSet(data.ts[i:j], data.rows[i:j], data.parts[i:j])
+
+    def concat(self, a, b):
+        if not b.ts:
+            return a
+        return RowSet(a.ts + b.ts, a.rows + b.rows, a.parts + b.parts)
+
+    def nbytes(self, data):
+        return sum(map(len, data.parts)) + ROW_OVERHEAD * len(data.parts)
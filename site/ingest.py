@@ -0,0 +1,280 @@
+# ingest.py
+# Write-behind buffer for readings: producers append to an in-memory queue
+# and a single writer thread inserts them in batches, one transaction
+# (one fsync) per batch instead of one per reading.
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from database import DEFAULT_SENSOR, get_db
+
+BATCH_SIZE = int(os.environ.get("AERIUM_INGEST_BATCH", "500"))
+FLUSH_INTERVAL = float(os.environ.get("AERIUM_INGEST_FLUSH_S", "1.0"))
+MAX_PENDING = int(os.environ.get("AERIUM_INGEST_MAX_PENDING", "100000"))
+
+INSERT_SQL = "INSERT OR IGNORE INTO co2_readings (sensor_id, ts, ppm) VALUES (?, ?, ?)"
+SENSOR_SQL = """
+    INSERT OR IGNORE INTO sensors (sensor_id, created_at)
+    VALUES (?, CAST(strftime('%s', 'now') AS INTEGER))
+"""
+
+
+class WriteBehindBuffer:
+    """Bounded queue of (sensor_id, ts, ppm) rows drained by one writer thread.
+
+    When more than max_pending rows are waiting (database stalled), the
+    oldest rows are dropped and counted, so memory stays bounded.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._oldest = None
+        self._stop = False
+        self._thread = None
+
+        # run inside the batch transaction: (fn(db, rows), isolated)
+        self._hooks = []
+        # run after commit: fn(rows)
+        self._listeners = []
+
+        self._received = 0
+        self._written = 0
+        self._ignored = 0   # duplicates of stored (sensor_id, ts) keys
+        self._dropped = 0
+        self._batches = 0
+        self._errors = 0
+        self._hook_errors = 0
+        self._flush_total = 0.0
+        self._flush_max = 0.0
+        self._flush_last = 0.0
+        self._recent = deque()  # (monotonic time, rows) of the last minute
+
+    def add_hook(self, fn, isolated=False):
+        """fn(db, rows) runs in the batch transaction. If it raises, the
+        batch fails, unless isolated: then only the hook's own writes are
+        undone (savepoint) and the readings are still stored."""
+        self._hooks.append((fn, isolated))
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(
+            target=self._run, name="co2-ingest-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        # whatever arrived after the thread exited
+        self.flush()
+
+    def put(self, ts, ppm, sensor_id=DEFAULT_SENSOR):
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self._dropped += 1
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((sensor_id, ts, ppm))
+            self._received += 1
+
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self):
+        """Synchronously write everything queued so far."""
+        with self._cond:
+            batch = self._take()
+        if batch:
+            self._write(batch)
+
+    def _take(self):
+        batch = list(self._pending)
+        self._pending.clear()
+        self._oldest = None
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stop:
+                    if len(self._pending) >= self.batch_size:
+                        break
+                    if self._oldest is not None:
+                        remaining = self._oldest + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+
+                batch = self._take()
+                stopping = self._stop
+
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _insert(self, db, batch):
+        # first reading of a new sensor registers it
+        db.executemany(SENSOR_SQL, [(s,) for s in {row[0] for row in batch}])
+        before = db.total_changes
+        db.executemany(INSERT_SQL, batch)
+        inserted = db.total_changes - before
+        for hook, isolated in self._hooks:
+            if not isolated:
+                hook(db, batch)
+                continue
+            db.execute("SAVEPOINT hook")
+            try:
+                hook(db, batch)
+            except Exception as e:
+                db.execute("ROLLBACK TO hook")
+                with self._cond:
+                    self._hook_errors += 1
+                print(f"[ingest] {getattr(hook, '__qualname__', hook)} failed, batch stored without it: {e}")
+            db.execute("RELEASE hook")
+        return inserted
+
+    def _notify(self, batch):
+        for listener in self._listeners:
+            try:
+                listener(batch)
+            except Exception as e:
+                print(f"[ingest] listener failed: {e}")
+
+    def _write(self, batch):
+        with self._write_lock:
+            start = time.perf_counter()
+            db = get_db()
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                inserted = self._insert(db, batch)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                self._requeue(batch)
+                self._errors += 1
+                print(f"[ingest] batch of {len(batch)} failed, requeued: {e}")
+                return
+            finally:
+                db.close()
+
+            elapsed = time.perf_counter() - start
+            self._record(len(batch), inserted, elapsed)
+
+        self._notify(batch)
+
+    def write(self, batch, prepare=None):
+        """Insert rows now, in one transaction with the hooks, bypassing
+        the queue. prepare(db) runs first in the same transaction; if it
+        returns False nothing is written and None is returned. Otherwise
+        returns the number of new rows (duplicates are ignored). Errors
+        propagate to the caller instead of being requeued.
+        """
+        with self._write_lock:
+            start = time.perf_counter()
+            db = get_db()
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                if prepare is not None and prepare(db) is False:
+                    db.rollback()
+                    return None
+                inserted = self._insert(db, batch)
+                db.commit()
+            except Exception:
+                db.rollback()
+                with self._cond:
+                    self._errors += 1
+                raise
+            finally:
+                db.close()
+
+            with self._cond:
+                self._received += len(batch)
+            self._record(len(batch), inserted, time.perf_counter() - start)
+
+        self._notify(batch)
+        return inserted
+
+    def _requeue(self, batch):
+        # put the failed rows back in front, still honouring max_pending
+        with self._cond:
+            room = self.max_pending - len(self._pending)
+            keep = batch[-room:] if room > 0 else []
+            self._dropped += len(batch) - len(keep)
+            self._pending.extendleft(reversed(keep))
+            if self._pending and self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _record(self, rows, inserted, elapsed):
+        # rows that INSERT OR IGNORE skipped are not written
+        now = time.monotonic()
+        with self._cond:
+            self._written += inserted
+            self._ignored += rows - inserted
+            self._batches += 1
+            self._flush_total += elapsed
+            self._flush_last = elapsed
+            self._flush_max = max(self._flush_max, elapsed)
+
+            self._recent.append((now, inserted))
+            while self._recent and self._recent[0][0] < now - 60:
+                self._recent.popleft()
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            window = [n for t, n in self._recent if t >= now - 60]
+            return {
+                "pending": len(self._pending),
+                "max_pending": self.max_pending,
+                "batch_size": self.batch_size,
+                "flush_interval_s": self.flush_interval,
+                "received": self._received,
+                "written": self._written,
+                "ignored": self._ignored,
+                "dropped": self._dropped,
+                "errors": self._errors,
+                "hook_errors": self._hook_errors,
+                "batches": self._batches,
+                "rows_per_s_1m": round(sum(window) / 60, 2),
+                "flush_last_ms": round(self._flush_last * 1000, 3),
+                "flush_avg_ms": round(self._flush_total * 1000 / self._batches, 3)
+                if self._batches else 0.0,
+                "flush_max_ms": round(self._flush_max * 1000, 3),
+            }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteBehindBuffer()
+                _writer.start()
+                atexit.register(_writer.stop)
+    return _writer
@@ -0,0 +1,208 @@
+# metrics.py
+# In-process instrumentation exposed by /metrics in the Prometheus text
+# format: histograms and counters updated where the work happens (requests,
+# SQL statements, pool checkouts, PDF rendering), gauges sampled only when
+# scraped. No dependency; recording is a bisect and a short lock.
+import os
+import re
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+AGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300)
+PDF_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+# statements slower than this are printed (0: off)
+SLOW_QUERY_MS = float(os.environ.get("AERIUM_SLOW_QUERY_MS", "0"))
+
+# distinct statement labels kept; beyond that they are counted as "other"
+MAX_STATEMENTS = 200
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [count per bucket..., +Inf, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, counts in sorted(series.items()):
+            total = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                total += n
+                le = _labels(self.labelnames, values, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {total}")
+            labels = _labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {counts[-1]!r}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        # an unlabelled counter is exported (as 0) before its first inc()
+        self._values = {} if labels else {(): 0}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Sampled:
+    """Gauge or counter read from fn() at scrape time; fn returns a number,
+    or {label values tuple: number} when labels are given."""
+
+    def __init__(self, name, help, fn, type="gauge", labels=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.type = type
+        self.labelnames = tuple(labels)
+        _registry.append(self)
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            return [f"# {self.name} unavailable: {_escape(e)}"]
+
+        values = value if self.labelnames else {(): value}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, v in sorted(values.items()):
+            if v is not None:
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(v)}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_statements = {}
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_label(sql):
+    """One label per SQL text (values are always bound parameters, so the
+    number of distinct statements is that of the code)."""
+    label = _statements.get(sql)
+    if label is None:
+        if len(_statements) >= MAX_STATEMENTS:
+            return "other"
+        label = _WHITESPACE.sub(" ", sql).strip()
+        if len(label) > 160:
+            label = label[:157] + "..."
+        _statements[sql] = label
+    return label
+
+
+http_duration = Histogram(
+    "aerium_http_request_duration_seconds",
+    "Time to produce the response (first byte for streams), by route.",
+    labels=("method", "route"),
+)
+http_responses = Counter(
+    "aerium_http_responses_total", "Responses by route and status code.",
+    labels=("method", "route", "status"),
+)
+sql_duration = Histogram(
+    "aerium_sql_statement_duration_seconds",
+    "SQLite statement time, from execute() until its rows are read "
+    "(next statement or connection release).",
+    labels=("statement",), buckets=SQL_BUCKETS,
+)
+slow_statements = Counter(
+    "aerium_sql_slow_statements_total",
+    "Statements over AERIUM_SLOW_QUERY_MS.", labels=("statement",),
+)
+sql_locked = Counter(
+    "aerium_sql_locked_total",
+    "Statements that failed with \"database is locked\" or busy.",
+)
+pool_timeouts = Counter(
+    "aerium_db_pool_timeouts_total",
+    "Checkouts that found no free connection within the pool timeout.",
+)
+pool_wait = Histogram(
+    "aerium_db_pool_wait_seconds",
+    "Time to check a connection out of the pool.", buckets=SQL_BUCKETS,
+)
+sample_age = Histogram(
+    "aerium_sample_age_seconds",
+    "Age of the latest reading when served, from its acquisition timestamp.",
+    labels=("via",), buckets=AGE_BUCKETS,
+)
+pdf_render = Histogram(
+    "aerium_pdf_render_seconds", "WeasyPrint rendering time of one report.",
+    buckets=PDF_BUCKETS,
+)
+
+
+def record_statement(sql, seconds):
+    label = statement_label(sql)
+    sql_duration.observe(seconds, label)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        slow_statements.inc(label)
+        print(f"[db] slow statement ({seconds * 1000:.1f} ms): {label}")
+
+
+def record_sql_error(error):
+    message = str(error)
+    if "locked" in message or "busy" in message:
+        sql_locked.inc()
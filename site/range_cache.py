@@ -0,0 +1,142 @@
+# range_cache.py
+# Read-through cache for the ranges the dashboards keep asking for (today,
+# 7d, 30d of one sensor). An entry holds the part of a range that can no
+# longer change; a repeat request drops the head that slid out of the
+# range and reads only the tail since then from the database.
+#
+# Readings normally arrive in time order, within a flush interval: the
+# last SETTLE_S seconds are never trusted and always re-read. Older rows
+# (a node catching up) reach the ingest listener, which moves the entries
+# of that sensor back so the affected part is re-read. Rows written by
+# another serve.py process only reach its own listener; TTL_S bounds how
+# long such a late batch can stay invisible here.
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+BUDGET_BYTES = int(os.environ.get("AERIUM_RANGE_CACHE_MB", "64")) * 2**20
+SETTLE_S = int(os.environ.get("AERIUM_RANGE_CACHE_SETTLE_S", "5"))
+TTL_S = int(os.environ.get("AERIUM_RANGE_CACHE_TTL_S", "300"))
+
+# ingest batches remembered for requests that were reading meanwhile
+LOG_SIZE = 256
+
+
+class Entry:
+    __slots__ = ("sensor_id", "step", "start", "complete", "data", "nbytes", "loaded")
+
+    def __init__(self, sensor_id, step, start, complete, data, nbytes, loaded):
+        self.sensor_id = sensor_id
+        self.step = step
+        self.start = start
+        self.complete = complete  # data is final for ts < complete
+        self.data = data
+        self.nbytes = nbytes
+        self.loaded = loaded      # last full load, for TTL_S
+
+
+class RangeCache:
+    """LRU of range entries under a byte budget.
+
+    `kind` describes the cached data (see history.Rows, analysis.SeriesKind):
+    step (bucket size, 1 for raw readings), load(sensor_id, start, end),
+    slice(data, lo, hi) keeping lo <= ts < hi, concat(a, b) and nbytes(data).
+    """
+
+    def __init__(self, budget=BUDGET_BYTES, settle=SETTLE_S, ttl=TTL_S):
+        self.budget = budget
+        self.settle = settle
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._log = deque(maxlen=LOG_SIZE)  # (seq, sensor_id, oldest ts)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, sensor_id, start, end, kind, now=None):
+        """The data of [start, end), start aligned down to kind.step."""
+        now = time.time() if now is None else now
+        step = kind.step
+        lo = start - start % step
+        settled = min(end, int(now) - self.settle)
+        settled = max(lo, settled - settled % step)
+
+        with self._lock:
+            seq = self._seq
+            entry = self._entries.get(key)
+            if entry is not None and entry.start <= lo < entry.complete and now - entry.loaded < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                cached, complete, loaded = entry.data, entry.complete, entry.loaded
+            else:
+                self.misses += 1
+                cached = None
+
+        if cached is not None:
+            tail = kind.load(sensor_id, complete, end)
+            data = kind.concat(kind.slice(cached, lo, complete), tail)
+        else:
+            data = kind.load(sensor_id, start, end)
+            loaded = now
+
+        stored = kind.slice(data, lo, settled)
+        with self._lock:
+            if len(self._log) == self._log.maxlen and self._log[0][0] > seq + 1:
+                return data  # missed batches: cannot tell what is final
+            # batches committed while we were reading
+            for s, sid, oldest in self._log:
+                if s > seq and sid == sensor_id and oldest < settled:
+                    settled = max(lo, oldest - oldest % step)
+                    stored = kind.slice(stored, lo, settled)
+            self._put(key, Entry(sensor_id, step, lo, settled, stored, kind.nbytes(stored), loaded))
+        return data
+
+    def _put(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        if entry.nbytes > self.budget:
+            return
+        while self._entries and self._bytes + entry.nbytes > self.budget:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+        self._entries[key] = entry
+        self._bytes += entry.nbytes
+
+    def on_ingest(self, rows):
+        """Ingest listener: rows (sensor_id, ts, ppm) were committed."""
+        oldest = {}
+        for sensor_id, ts, _ in rows:
+            if ts < oldest.get(sensor_id, ts + 1):
+                oldest[sensor_id] = ts
+
+        with self._lock:
+            self._seq += 1
+            for sensor_id, ts in oldest.items():
+                self._log.append((self._seq, sensor_id, ts))
+
+            for entry in self._entries.values():
+                ts = oldest.get(entry.sensor_id)
+                if ts is not None and ts < entry.complete:
+                    # re-read from the bucket holding it on the next request
+                    entry.complete = max(entry.start, ts - ts % entry.step)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,169 @@
+# readings.py
+# Batches pushed by remote sensor nodes (POST /api/readings): body parsing
+# (JSON, NDJSON or packed binary), validation, in-batch dedupe and the
+# idempotent insert.
+#
+#   JSON    {"sensor_id": "b12", "node": "pi-3", "seq": 41,
+#            "readings": [[1760000000, 612], {"ts": 1760000001, "ppm": 615}]}
+#   NDJSON  the same header object on the first line, then one reading per line
+#   binary  ?sensor=b12&node=pi-3&seq=41, body = packed <uint32 ts, uint16 ppm>
+#
+# seq is optional but must increase with every new batch of a node; a
+# batch whose seq was already accepted is answered without writing.
+import json
+import os
+import struct
+import time
+from datetime import datetime, timezone
+
+from database import DEFAULT_SENSOR
+from history import parse_time
+from ingest import get_writer
+from sensors import valid_sensor_id
+
+MAX_BATCH = int(os.environ.get("AERIUM_READINGS_MAX_BATCH", "50000"))
+# NDIR sensor range; anything outside is a faulty reading
+MIN_PPM = 0
+MAX_PPM = 10000
+# node clocks may run slightly ahead of ours; a node that has not synced
+# its clock yet reports 1970 dates
+MAX_FUTURE_S = 300
+MIN_TS = 946684800  # 2000-01-01
+
+RECORD = struct.Struct("<IH")
+
+CLAIM_SQL = """
+    INSERT INTO ingest_nodes (node_id, last_seq, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT (node_id) DO UPDATE
+    SET last_seq = excluded.last_seq, updated_at = excluded.updated_at
+"""
+
+
+def parse_body(mimetype, body, args):
+    """(header, readings) from a request body; raises ValueError."""
+    if mimetype == "application/octet-stream":
+        if len(body) % RECORD.size:
+            raise ValueError(f"Binary body must be a multiple of {RECORD.size} bytes")
+        header = {
+            "sensor_id": args.get("sensor"),
+            "node": args.get("node"),
+            "seq": args.get("seq"),
+        }
+        return header, list(RECORD.iter_unpack(body))
+
+    if mimetype in ("application/x-ndjson", "application/jsonl"):
+        lines = [line for line in body.splitlines() if line.strip()]
+        if not lines:
+            raise ValueError("Empty body")
+        header = json.loads(lines[0])
+        readings = [json.loads(line) for line in lines[1:]]
+    elif mimetype == "application/json":
+        header = json.loads(body)
+        readings = header.get("readings") if isinstance(header, dict) else None
+    else:
+        raise ValueError("Unsupported content type")
+
+    if not isinstance(header, dict) or not isinstance(readings, list):
+        raise ValueError("Expected a header object and a list of readings")
+    return header, readings
+
+
+def _reading(item):
+    if isinstance(item, dict):
+        return item.get("ts"), item.get("ppm")
+    if isinstance(item, (list, tuple)) and len(item) == 2:
+        return item
+    return None, None
+
+
+def clean(readings, now):
+    """{ts: ppm} of the valid readings (first one wins per ts) and the
+    number rejected."""
+    rows = {}
+    rejected = 0
+    newest = now + MAX_FUTURE_S
+
+    for item in readings:
+        ts, ppm = _reading(item)
+        # true/false are ints to Python, not readings
+        if isinstance(ts, bool) or isinstance(ppm, bool):
+            rejected += 1
+            continue
+        try:
+            if not isinstance(ts, int):
+                ts = parse_time(str(ts))
+            if not isinstance(ppm, int):
+                ppm = int(ppm)
+        except (TypeError, ValueError, OverflowError):
+            rejected += 1
+            continue
+
+        if not (MIN_TS <= ts <= newest and MIN_PPM <= ppm <= MAX_PPM):
+            rejected += 1
+            continue
+        rows.setdefault(ts, ppm)
+
+    return rows, rejected
+
+
+def ingest(header, readings, now=None):
+    """Validate and store one batch; returns (result, stored (ts, ppm) rows
+    in time order, empty for a replayed batch). Raises ValueError for a
+    malformed batch."""
+    now = int(now if now is not None else time.time())
+
+    sensor_id = header.get("sensor_id") or DEFAULT_SENSOR
+    node_id = header.get("node") or sensor_id
+    if not valid_sensor_id(sensor_id) or not valid_sensor_id(node_id):
+        raise ValueError("Invalid sensor or node id")
+
+    seq = header.get("seq")
+    if seq is not None:
+        try:
+            if isinstance(seq, bool):
+                raise TypeError
+            seq = int(seq)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError("seq must be an integer")
+        if not 0 <= seq < 2**63:
+            raise ValueError("seq out of range")
+
+    if len(readings) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} readings per batch")
+
+    rows, rejected = clean(readings, now)
+    batch = [(sensor_id, ts, ppm) for ts, ppm in sorted(rows.items())]
+
+    def claim(db):
+        row = db.execute(
+            "SELECT last_seq FROM ingest_nodes WHERE node_id = ?", (node_id,)
+        ).fetchone()
+        if row is not None and seq <= row[0]:
+            return False
+        db.execute(CLAIM_SQL, (node_id, seq, now))
+
+    inserted = get_writer().write(batch, claim if seq is not None else None)
+
+    result = {
+        "sensor_id": sensor_id,
+        "node": node_id,
+        "seq": seq,
+        "received": len(readings),
+        "accepted": len(batch),
+        "rejected": rejected,
+        "inserted": inserted or 0,
+        "duplicates": len(batch) - inserted if inserted is not None else 0,
+        "replayed": inserted is None,
+    }
+    rows = [row[1:] for row in batch] if inserted is not None else []
+    return result, rows
+
+
+def latest_of(newest):
+    ts, ppm = newest
+    return {
+        "analysis_running": True,
+        "ppm": ppm,
+        "timestamp": datetime.fromtimestamp(ts, timezone.utc)
+        .replace(tzinfo=None).isoformat(),
+    }
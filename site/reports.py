@@ -0,0 +1,135 @@
+# reports.py
+# PDF rendering off the request thread: a small worker pool renders jobs,
+# finished PDFs are cached by (day, thresholds, data version). Reports of
+# past days are also kept on disk; readings a node uploads late change the
+# data version, so such a report is rendered again under a new key.
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+REPORT_WORKERS = int(os.environ.get("AERIUM_REPORT_WORKERS", "2"))
+MAX_CACHED = 32
+MAX_JOBS = 200
+
+
+class ReportJob:
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class ReportService:
+    def __init__(self, render_pdf, cache_dir, workers=REPORT_WORKERS, max_cached=MAX_CACHED):
+        # render_pdf(html) -> bytes, called on a worker thread
+        self.render_pdf = render_pdf
+        self.cache_dir = Path(cache_dir)
+        self.max_cached = max_cached
+
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="report")
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()   # key -> pdf bytes (LRU)
+        self._jobs = OrderedDict()    # job id -> ReportJob
+        self._inflight = {}           # key -> ReportJob
+
+    def _disk_path(self, key):
+        return self.cache_dir / ("-".join(str(k) for k in key) + ".pdf")
+
+    def cached(self, key, persistent=False):
+        with self._lock:
+            pdf = self._cache.get(key)
+            if pdf is not None:
+                self._cache.move_to_end(key)
+                return pdf
+
+        if persistent:
+            path = self._disk_path(key)
+            if path.exists():
+                pdf = path.read_bytes()
+                self._remember(key, pdf)
+                return pdf
+
+        return None
+
+    def _remember(self, key, pdf):
+        with self._lock:
+            self._cache[key] = pdf
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def submit(self, key, html, persistent=False):
+        """Queue a render; concurrent requests for the same key share a job."""
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                return job
+
+            job = ReportJob(key)
+            self._inflight[key] = job
+            self._track(job)
+
+        self._executor.submit(self._run, job, html, persistent)
+        return job
+
+    def completed(self, key):
+        # a job that is already done, for cache hits on the job API
+        job = ReportJob(key)
+        job.status = "done"
+        job.finished = job.created
+        job.done.set()
+        with self._lock:
+            self._track(job)
+        return job
+
+    def _track(self, job):
+        # caller holds self._lock; oldest jobs are forgotten past MAX_JOBS
+        self._jobs[job.id] = job
+        while len(self._jobs) > MAX_JOBS:
+            self._jobs.popitem(last=False)
+
+    def _run(self, job, html, persistent):
+        job.status = "running"
+        try:
+            pdf = self.render_pdf(html)
+            self._remember(job.key, pdf)
+
+            if persistent:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp = self._disk_path(job.key).with_suffix(".tmp")
+                tmp.write_bytes(pdf)
+                tmp.replace(self._disk_path(job.key))
+
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._inflight.pop(job.key, None)
+            job.done.set()
+
+    def job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def result(self, job):
+        return self.cached(job.key, persistent=True)
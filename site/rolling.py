@@ -0,0 +1,254 @@
+# rolling.py
+# Incremental statistics of live readings over sliding windows. Adding a
+# reading and taking a snapshot are O(1) (amortised) whatever the window
+# length: readings are merged into fixed-size buckets, running sums are
+# kept for the whole window and min/max come from monotonic deques.
+import threading
+import time
+from collections import deque
+
+DAY = 86400
+
+# name -> (span in seconds, None = since UTC midnight; bucket size in seconds)
+WINDOWS = {
+    "5m": (300, 1),
+    "1h": (3600, 10),
+    "today": (None, 60),
+}
+
+# a reading stands for the time until the next one, but not across a gap
+# longer than this (sensor offline, analysis paused)
+MAX_GAP_S = 300
+
+BANDS = ("good", "medium", "bad")
+
+
+class _Bucket:
+    __slots__ = ("start", "n", "sum", "st", "stt", "sty", "exposure")
+
+    def __init__(self, start):
+        self.start = start
+        self.n = 0
+        self.sum = 0
+        # sums of t, t² and t·ppm for the least-squares trend
+        self.st = 0
+        self.stt = 0
+        self.sty = 0
+        self.exposure = [0, 0, 0]
+
+    def add(self, t, ppm):
+        self.n += 1
+        self.sum += ppm
+        self.st += t
+        self.stt += t * t
+        self.sty += t * ppm
+
+    def remove(self, other):
+        self.n -= other.n
+        self.sum -= other.sum
+        self.st -= other.st
+        self.stt -= other.stt
+        self.sty -= other.sty
+        for i in range(3):
+            self.exposure[i] -= other.exposure[i]
+
+
+class RollingWindow:
+    """Readings of the last `span` seconds (None: since UTC midnight).
+
+    Timestamps are integer epoch seconds and must increase; older or
+    duplicate readings are ignored. All sums are integers, so adding and
+    evicting never drifts.
+    """
+
+    def __init__(self, span, resolution, good_threshold, bad_threshold):
+        self.span = span
+        self.resolution = resolution
+        self.good_threshold = good_threshold
+        self.bad_threshold = bad_threshold
+
+        self._buckets = deque()
+        self._total = _Bucket(None)
+        self._min = deque()   # (bucket start, ppm), ppm increasing
+        self._max = deque()   # (bucket start, ppm), ppm decreasing
+        self._last = None     # newest (ts, ppm)
+        self._origin = None   # keeps t small in the trend sums
+
+    def band(self, ppm):
+        if ppm < self.good_threshold:
+            return 0
+        if ppm < self.bad_threshold:
+            return 1
+        return 2
+
+    def cutoff(self, now):
+        if self.span is None:
+            return now - now % DAY
+        return now - self.span
+
+    def add(self, ts, ppm):
+        if self._last is not None:
+            last_ts, last_ppm = self._last
+            if ts <= last_ts:
+                return False
+            if self._buckets:
+                # the previous reading's exposure ends now
+                seconds = min(ts - last_ts, MAX_GAP_S)
+                i = self.band(last_ppm)
+                self._buckets[-1].exposure[i] += seconds
+                self._total.exposure[i] += seconds
+        if self._origin is None:
+            self._origin = ts
+        self._last = (ts, ppm)
+
+        start = ts - ts % self.resolution
+        if not self._buckets or self._buckets[-1].start != start:
+            self._buckets.append(_Bucket(start))
+
+        t = ts - self._origin
+        self._buckets[-1].add(t, ppm)
+        self._total.add(t, ppm)
+
+        while self._min and self._min[-1][1] >= ppm:
+            self._min.pop()
+        if not self._min or self._min[-1][0] != start:
+            self._min.append((start, ppm))
+
+        while self._max and self._max[-1][1] <= ppm:
+            self._max.pop()
+        if not self._max or self._max[-1][0] != start:
+            self._max.append((start, ppm))
+
+        self.evict(ts)
+        return True
+
+    def evict(self, now):
+        cutoff = self.cutoff(now)
+        while self._buckets and self._buckets[0].start + self.resolution <= cutoff:
+            self._total.remove(self._buckets.popleft())
+
+        first = self._buckets[0].start if self._buckets else None
+        for extremes in (self._min, self._max):
+            while extremes and (first is None or extremes[0][0] < first):
+                extremes.popleft()
+
+    def snapshot(self, now):
+        self.evict(now)
+        total = self._total
+        result = {
+            "from": self.cutoff(now),
+            "count": total.n,
+            "avg": None,
+            "min": None,
+            "max": None,
+            "exposure_s": dict.fromkeys(BANDS, 0),
+            "exposure_pct": dict.fromkeys(BANDS, 0),
+            "bad_minutes": 0,
+            "trend_ppm_per_min": None,
+        }
+        if not total.n:
+            return result
+
+        exposure = list(total.exposure)
+        # the newest reading is still going on
+        last_ts, last_ppm = self._last
+        exposure[self.band(last_ppm)] += max(0, min(now - last_ts, MAX_GAP_S))
+
+        covered = sum(exposure)
+        for i, band in enumerate(BANDS):
+            result["exposure_s"][band] = exposure[i]
+            result["exposure_pct"][band] = round(exposure[i] / covered * 100) if covered else 0
+
+        result["avg"] = round(total.sum / total.n)
+        result["min"] = self._min[0][1]
+        result["max"] = self._max[0][1]
+        result["bad_minutes"] = round(exposure[2] / 60)
+
+        den = total.n * total.stt - total.st * total.st
+        if den:
+            slope = (total.n * total.sty - total.st * total.sum) / den
+            result["trend_ppm_per_min"] = round(slope * 60, 1)
+
+        return result
+
+
+class RollingStats:
+    """Every window of WINDOWS for one sensor."""
+
+    def __init__(self, good_threshold, bad_threshold):
+        self.lock = threading.Lock()
+        self.windows = {
+            name: RollingWindow(span, resolution, good_threshold, bad_threshold)
+            for name, (span, resolution) in WINDOWS.items()
+        }
+
+    def add(self, ts, ppm):
+        for window in self.windows.values():
+            window.add(ts, ppm)
+
+    def snapshot(self, now):
+        return {name: w.snapshot(now) for name, w in self.windows.items()}
+
+
+class LiveStats:
+    """RollingStats per sensor, created on first use and seeded from the
+    database so a restart does not reset the day."""
+
+    def __init__(self, load_settings, load_readings):
+        # load_readings(start, end, sensor_id) -> [{"ts", "ppm"}, ...]
+        self.load_settings = load_settings
+        self.load_readings = load_readings
+        self._sensors = {}
+        self._thresholds = None
+        self._lock = threading.Lock()
+
+    def _stats(self, sensor_id):
+        settings = self.load_settings()
+        thresholds = (settings["good_threshold"], settings["bad_threshold"])
+
+        with self._lock:
+            if thresholds != self._thresholds:
+                # band counters were built with the old thresholds
+                self._thresholds = thresholds
+                self._sensors.clear()
+
+            stats = self._sensors.get(sensor_id)
+            if stats is not None:
+                return stats
+
+            stats = RollingStats(*thresholds)
+            # held until seeded: live readings must come after the history
+            stats.lock.acquire()
+            self._sensors[sensor_id] = stats
+
+        try:
+            now = int(time.time())
+            spans = [span for span, _ in WINDOWS.values() if span is not None]
+            start = min(now - now % DAY, now - max(spans))
+            for row in self.load_readings(start, now + 1, sensor_id):
+                stats.add(row["ts"], row["ppm"])
+        except Exception as e:
+            print(f"[rolling] seeding {sensor_id} failed: {e}")
+        finally:
+            stats.lock.release()
+        return stats
+
+    def add(self, sensor_id, ts, ppm):
+        stats = self._stats(sensor_id)
+        with stats.lock:
+            stats.add(int(ts), ppm)
+
+    def add_many(self, sensor_id, rows):
+        # rows: (ts, ppm) in time order
+        stats = self._stats(sensor_id)
+        with stats.lock:
+            for ts, ppm in rows:
+                stats.add(int(ts), ppm)
+
+    def snapshot(self, sensor_id, now=None):
+        now = int(now if now is not None else time.time())
+        stats = self._stats(sensor_id)
+        with stats.lock:
+            result = stats.snapshot(now)
+        result["sensor_id"] = sensor_id
+        return result
@@ -0,0 +1,335 @@
+# rollups.py
+# Minute / hour / day aggregates of co2_readings. The ingest writer calls
+# apply() inside each batch transaction, so long-range history reads a few
+# hundred pre-aggregated rows instead of millions of raw readings.
+#
+# Besides count / sum / min / max, each bucket holds the readings and the
+# seconds at or above each threshold. A reading stands for the time until
+# the next one, at most MAX_GAP_S (as in analysis.durations), all counted
+# in the reading's own bucket. Those columns depend on the thresholds:
+# rollup_state records the ones they were computed with, and a threshold
+# change rebuilds them.
+import threading
+import time
+
+from config import load_settings, thresholds as settings_thresholds
+from database import DEFAULT_SENSOR, get_db
+from rolling import MAX_GAP_S
+
+DAY = 86400
+
+# rebuild() pause between transactions: a writer waiting for the lock
+# polls at least every 100 ms (SQLite busy handler), so it gets a turn
+REBUILD_PAUSE_S = 0.1
+
+# (table suffix, bucket size in seconds, finer level it is built from)
+LEVELS = [
+    ("minute", 60, None),
+    ("hour", 3600, "minute"),
+    ("day", 86400, "hour"),
+]
+
+# threshold columns, summed from one level to the next
+EXPOSURE_COLUMNS = ("n_over_good", "n_over_bad", "n_over_alert",
+                    "secs", "s_over_good", "s_over_bad", "s_over_alert")
+
+# one sensor's readings with ts in [lo, hi) and the seconds each stands
+# for, cut at `clip`. Rows up to MAX_GAP_S past hi are read for LEAD().
+# Parameters: clip, sensor_id, lo, hi, hi.
+SPANS_SQL = f"""
+    SELECT ts, ppm, secs
+    FROM (
+        SELECT ts, ppm,
+               MIN(COALESCE(LEAD(ts) OVER (ORDER BY ts), ts + {MAX_GAP_S}), ts + {MAX_GAP_S}, ?) - ts AS secs
+        FROM co2_readings
+        WHERE sensor_id = ? AND ts >= ? AND ts < ? + {MAX_GAP_S}
+    )
+    WHERE ts < ?
+"""
+
+# aggregates over SPANS_SQL rows; parameters: good, bad, alert x 2
+TOTALS_COLUMNS = """
+    COUNT(*), SUM(ppm), MIN(ppm), MAX(ppm),
+    SUM(ppm >= ?), SUM(ppm >= ?), SUM(ppm >= ?),
+    SUM(secs), SUM(secs * (ppm >= ?)), SUM(secs * (ppm >= ?)), SUM(secs * (ppm >= ?))
+"""
+
+# rollup_state.complete = 0 while a rebuild is running
+STATE_SQL = """
+    INSERT INTO rollup_state (id, good, bad, alert, complete) VALUES (1, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE
+    SET good = excluded.good, bad = excluded.bad, alert = excluded.alert,
+        complete = excluded.complete
+"""
+
+# no reading is that late: SPANS_SQL without a cut
+NO_CLIP = 2**62
+
+
+def state(db=None):
+    """(thresholds, complete) the rollups are computed with; (None, False)
+    before the first build."""
+    if db is None:
+        with get_db() as db:
+            return state(db)
+    row = db.execute("SELECT good, bad, alert, complete FROM rollup_state").fetchone()
+    if row is None:
+        return None, False
+    return (row[0], row[1], row[2]), bool(row[3])
+
+
+def _runs(buckets, size):
+    # merge bucket starts into contiguous [start, end) spans
+    runs = []
+    for b in sorted(buckets):
+        if runs and runs[-1][1] == b:
+            runs[-1][1] = b + size
+        else:
+            runs.append([b, b + size])
+    return runs
+
+
+def _refresh(db, level, size, source, sensor_id, start, end, thresholds):
+    # recompute one sensor's buckets in [start, end) from the finer level;
+    # idempotent, so duplicate or late readings never double count
+    db.execute(
+        f"DELETE FROM co2_rollup_{level} WHERE sensor_id = ? AND bucket >= ? AND bucket < ?",
+        (sensor_id, start, end)
+    )
+
+    if source is None:
+        db.execute(f"""
+            INSERT INTO co2_rollup_minute
+                (sensor_id, bucket, n, sum, min, max, {", ".join(EXPOSURE_COLUMNS)})
+            SELECT ?, ts - ts % 60, {TOTALS_COLUMNS}
+            FROM ({SPANS_SQL})
+            GROUP BY 2
+        """, (sensor_id, *thresholds, *thresholds, NO_CLIP, sensor_id, start, end, end))
+    else:
+        sums = ", ".join(f"SUM({c})" for c in EXPOSURE_COLUMNS)
+        db.execute(f"""
+            INSERT INTO co2_rollup_{level}
+                (sensor_id, bucket, n, sum, min, max, {", ".join(EXPOSURE_COLUMNS)})
+            SELECT sensor_id, bucket - bucket % {size}, SUM(n), SUM(sum), MIN(min), MAX(max), {sums}
+            FROM co2_rollup_{source}
+            WHERE sensor_id = ? AND bucket >= ? AND bucket < ?
+            GROUP BY 2
+        """, (sensor_id, start, end))
+
+
+def apply(db, rows):
+    """Ingest hook: refresh every bucket touched by a batch of (sensor_id, ts, ppm)."""
+    thresholds, _ = state(db)
+    if thresholds is None:
+        thresholds = settings_thresholds(load_settings())
+
+    by_sensor = {}
+    for sensor_id, ts, _ in rows:
+        by_sensor.setdefault(sensor_id, set()).add(ts)
+
+    for sensor_id, touched in by_sensor.items():
+        # a new reading also shortens the time its predecessor stands for;
+        # inside a run of touched minutes that one is in the run, or it is
+        # the last reading before the run
+        touched = {t - t % 60 for t in touched}
+        for start, _ in _runs(touched, 60):
+            before = db.execute(
+                "SELECT MAX(ts) FROM co2_readings WHERE sensor_id = ? AND ts < ?",
+                (sensor_id, start)
+            ).fetchone()[0]
+            if before is not None:
+                touched.add(before - before % 60)
+
+        for level, size, source in LEVELS:
+            touched = {t - t % size for t in touched}
+            for start, end in _runs(touched, size):
+                _refresh(db, level, size, source, sensor_id, start, end, thresholds)
+
+
+def rebuild(thresholds=None, pause=REBUILD_PAUSE_S):
+    """Recompute all rollups from raw readings (first start, backfill,
+    threshold change), with the current thresholds by default. Returns
+    False if a rebuild for other thresholds took over meanwhile.
+
+    One short transaction per sensor and day (a day holds whole buckets of
+    every level), so ingest batches keep committing in between instead of
+    waiting on the write lock for the whole table.
+    """
+    if thresholds is None:
+        thresholds = settings_thresholds(load_settings())
+    thresholds = tuple(thresholds)
+
+    with get_db() as db:
+        db.execute("BEGIN IMMEDIATE")
+        db.execute(STATE_SQL, (*thresholds, 0))
+        sensors = [r[0] for r in db.execute("SELECT sensor_id FROM sensors")]
+
+    for sensor_id in sensors:
+        with get_db() as db:
+            lo, hi = db.execute(
+                "SELECT MIN(ts), MAX(ts) FROM co2_readings WHERE sensor_id = ?", (sensor_id,)
+            ).fetchone()
+        if lo is None:
+            lo = hi = 0  # no readings: all its buckets go
+        else:
+            lo, hi = lo - lo % DAY, hi - hi % DAY + DAY
+
+        with get_db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            if state(db)[0] != thresholds:
+                return False
+            for level, _, _ in LEVELS:
+                db.execute(
+                    f"DELETE FROM co2_rollup_{level} WHERE sensor_id = ? AND (bucket < ? OR bucket >= ?)",
+                    (sensor_id, lo, hi)
+                )
+
+        day = lo
+        while day < hi:
+            with get_db() as db:
+                db.execute("BEGIN IMMEDIATE")
+                if state(db)[0] != thresholds:
+                    return False
+                for level, size, source in LEVELS:
+                    _refresh(db, level, size, source, sensor_id, day, day + DAY, thresholds)
+
+                # days without readings are skipped, their buckets dropped
+                nxt = db.execute(
+                    "SELECT MIN(ts) FROM co2_readings WHERE sensor_id = ? AND ts >= ?",
+                    (sensor_id, day + DAY)
+                ).fetchone()[0]
+                nxt = hi if nxt is None else nxt - nxt % DAY
+                for level, _, _ in LEVELS:
+                    db.execute(
+                        f"DELETE FROM co2_rollup_{level} WHERE sensor_id = ? AND bucket >= ? AND bucket < ?",
+                        (sensor_id, day + DAY, nxt)
+                    )
+            day = nxt
+            if pause:
+                time.sleep(pause)
+
+    with get_db() as db:
+        db.execute("BEGIN IMMEDIATE")
+        if state(db)[0] != thresholds:
+            return False
+        db.execute(STATE_SQL, (*thresholds, 1))
+    return True
+
+
+def rebuild_async(thresholds):
+    """rebuild() for new thresholds in the background. Readings keep being
+    stored meanwhile; an older rebuild still running gives up."""
+    def run():
+        start = time.perf_counter()
+        try:
+            done = rebuild(thresholds)
+        except Exception as e:
+            # stats keep using raw readings; the next start retries
+            print(f"[rollups] rebuild for thresholds {thresholds} failed: {e}")
+            return
+        if done:
+            print(f"[rollups] rebuilt for thresholds {thresholds} in {time.perf_counter() - start:.1f} s")
+
+    threading.Thread(target=run, name="co2-rollup-rebuild", daemon=True).start()
+
+
+def ensure_built():
+    # first start after a rollup migration, or a rebuild that did not
+    # finish: recompute from existing readings
+    with get_db() as db:
+        empty = db.execute("SELECT 1 FROM co2_rollup_minute LIMIT 1").fetchone() is None
+        has_rows = db.execute("SELECT 1 FROM co2_readings LIMIT 1").fetchone() is not None
+        built, complete = state(db)
+
+    thresholds = settings_thresholds(load_settings())
+    if (empty and has_rows) or not complete or built != thresholds:
+        rebuild(thresholds, pause=0)  # at startup, before the ingest writer runs
+
+
+def fetch(level, start, end, sensor_id=DEFAULT_SENSOR):
+    size = next(s for name, s, _ in LEVELS if name == level)
+
+    with get_db() as db:
+        rows = db.execute(f"""
+            SELECT bucket AS ts, datetime(bucket, 'unixepoch') AS timestamp,
+                   CAST(ROUND(1.0 * sum / n) AS INTEGER) AS ppm,
+                   min, max, n
+            FROM co2_rollup_{level}
+            WHERE sensor_id = ? AND bucket >= ? AND bucket < ?
+            ORDER BY bucket
+        """, (sensor_id, start - start % size, end)).fetchall()
+
+    return [dict(r) for r in rows]
+
+
+def count_readings(start, end, sensor_id=DEFAULT_SENSOR):
+    # approximate (whole hours at the edges), but only reads ~24 rows per day
+    with get_db() as db:
+        return db.execute("""
+            SELECT COALESCE(SUM(n), 0)
+            FROM co2_rollup_hour
+            WHERE sensor_id = ? AND bucket >= ? AND bucket < ?
+        """, (sensor_id, start - start % 3600, end)).fetchone()[0]
+
+
+def _bucket_totals(db, level, sensor_id, start, end):
+    sums = ", ".join(f"SUM({c})" for c in EXPOSURE_COLUMNS)
+    return db.execute(f"""
+        SELECT SUM(n), SUM(sum), MIN(min), MAX(max), {sums}
+        FROM co2_rollup_{level}
+        WHERE sensor_id = ? AND bucket >= ? AND bucket < ?
+    """, (sensor_id, start, end)).fetchone()
+
+
+def _raw_totals(db, sensor_id, start, end, clip, thresholds):
+    return db.execute(f"SELECT {TOTALS_COLUMNS} FROM ({SPANS_SQL})", (
+        *thresholds, *thresholds, clip, sensor_id, start, end, end
+    )).fetchone()
+
+
+def totals(start, end, thresholds, sensor_id=DEFAULT_SENSOR):
+    """Aggregates of one sensor's readings in [start, end) as a dict: n,
+    sum, min, max and the EXPOSURE_COLUMNS, with the last reading's time cut
+    at `end` (as analysis.durations does). Whole hours and minutes come from
+    the rollups, the edges from raw readings: a 30-day range reads under a
+    thousand rows. None unless the rollups are built with `thresholds`."""
+    thresholds = tuple(thresholds)
+
+    # buckets must end MAX_GAP_S before `end`: no reading in them reaches it
+    first = start + (-start) % 60
+    last = end - MAX_GAP_S
+    last -= last % 60
+    hour_first = first + (-first) % 3600
+    hour_last = last - last % 3600
+
+    with get_db() as db:
+        built, complete = state(db)
+        if not complete or built != thresholds:
+            return None
+
+        if last <= first:
+            parts = [_raw_totals(db, sensor_id, start, end, end, thresholds)]
+        else:
+            parts = [_raw_totals(db, sensor_id, start, first, end, thresholds)]
+            if hour_first < hour_last:
+                parts.append(_bucket_totals(db, "minute", sensor_id, first, hour_first))
+                parts.append(_bucket_totals(db, "hour", sensor_id, hour_first, hour_last))
+                parts.append(_bucket_totals(db, "minute", sensor_id, hour_last, last))
+            else:
+                parts.append(_bucket_totals(db, "minute", sensor_id, first, last))
+            parts.append(_raw_totals(db, sensor_id, last, end, end, thresholds))
+
+    names = ("n", "sum", "min", "max") + EXPOSURE_COLUMNS
+    result = dict.fromkeys(names, 0)
+    result["min"] = result["max"] = None
+    for part in parts:
+        for name, value in zip(names, part):
+            if value is None:
+                continue
+            if name == "min":
+                result["min"] = value if result["min"] is None else min(result["min"], value)
+            elif name == "max":
+                result["max"] = value if result["max"] is None else max(result["max"], value)
+            else:
+                result[name] += value
+    return result
@@ -0,0 +1,64 @@
+# sensors.py
+# Sensor (room) registry and the per-sensor latest-value cache. Sensors are
+# registered by the ingest writer on their first reading.
+import re
+import threading
+
+from database import get_db
+
+# also used in report file names, so keep it filesystem-safe
+SENSOR_ID = re.compile(r"^[A-Za-z0-9_.-]{1,32}$")
+
+
+def valid_sensor_id(value):
+    return isinstance(value, str) and SENSOR_ID.match(value) is not None
+
+
+def empty_latest(sensor_id):
+    return {
+        "sensor_id": sensor_id,
+        "analysis_running": False,
+        "ppm": None,
+        "timestamp": None,
+    }
+
+
+class LatestCache:
+    """Last reading of every sensor, in process memory."""
+
+    def __init__(self):
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def update(self, sensor_id, latest):
+        with self._lock:
+            self._latest[sensor_id] = dict(latest, sensor_id=sensor_id)
+
+    def get(self, sensor_id):
+        with self._lock:
+            latest = self._latest.get(sensor_id)
+        return dict(latest) if latest else empty_latest(sensor_id)
+
+
+def list_sensors():
+    with get_db() as db:
+        rows = db.execute("""
+            SELECT sensor_id, room, created_at
+            FROM sensors
+            ORDER BY sensor_id
+        """).fetchall()
+
+    return [dict(r) for r in rows]
+
+
+def sensor_exists(sensor_id):
+    with get_db() as db:
+        row = db.execute("SELECT 1 FROM sensors WHERE sensor_id = ?", (sensor_id,)).fetchone()
+    return row is not None
+
+
+def set_room(sensor_id, room):
+    """Label a sensor with the room it sits in; False if it does not exist."""
+    with get_db() as db:
+        cur = db.execute("UPDATE sensors SET room = ? WHERE sensor_id = ?", (room, sensor_id))
+    return cur.rowcount > 0
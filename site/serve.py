@@ -0,0 +1,115 @@
+# serve.py
+# Production entry point: one acquisition process and N HTTP worker
+# processes sharing a listening socket. The latest reading of each sensor
+# and the settings version live in shared memory (shared_state.py), so any
+# worker answers /api/latest without IPC or database reads.
+#
+#   python serve.py --workers 4 --host 0.0.0.0 --port 5000
+#
+# POSIX only (workers are forked so they inherit the socket and mapping).
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+
+import database
+import rollups
+from shared_state import SharedState
+
+
+def _child_signals():
+    # the parent owns Ctrl+C; SIGTERM unwinds the child so it can flush
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+
+def run_acquisition(state):
+    _child_signals()
+    import app
+    from ingest import get_writer
+
+    # publish_latest() writes the readings to shared memory
+    app.use_shared_state(state, publish=False)
+    app.start_services(acquire=True)
+
+    try:
+        threading.Event().wait()
+    finally:
+        # multiprocessing children skip atexit: flush queued readings here
+        app.acquisition.stop()
+        get_writer().stop()
+
+
+def run_worker(state, fd, host, port):
+    _child_signals()
+    import app
+    from ingest import get_writer
+    from werkzeug.serving import make_server
+
+    flask_app = app.create_app(acquire=False, shared_state=state)
+    try:
+        make_server(host, port, flask_app, threaded=True, fd=fd).serve_forever()
+    finally:
+        get_writer().stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aerium multi-process server")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    # migrations run once, before forking; no sqlite connection may be
+    # inherited by a child
+    database.init_db()
+    rollups.ensure_built()
+    database.close_pool()
+
+    ctx = multiprocessing.get_context("fork")
+    state = SharedState(ctx.Lock())
+
+    sock = socket.create_server((args.host, args.port), backlog=256)
+    sock.set_inheritable(True)
+
+    specs = [("acquisition", run_acquisition, (state,))] + [
+        (f"worker-{i}", run_worker, (state, sock.fileno(), args.host, args.port))
+        for i in range(args.workers)
+    ]
+    children = {}
+
+    def spawn(spec):
+        name, target, target_args = spec
+        proc = ctx.Process(target=target, args=target_args, name=name)
+        proc.start()
+        children[proc] = spec
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+    for spec in specs:
+        spawn(spec)
+    print(f"[serve] http://{args.host}:{args.port} - {args.workers} workers + acquisition")
+
+    try:
+        while not stopping.wait(1):
+            for proc, spec in list(children.items()):
+                if not proc.is_alive():
+                    print(f"[serve] {spec[0]} exited ({proc.exitcode}), restarting")
+                    del children[proc]
+                    spawn(spec)
+    finally:
+        for proc in children:
+            proc.terminate()
+        for proc in children:
+            proc.join(10)
+        sock.close()
+        state.close(unlink=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# shared_state.py
+# Latest reading of every sensor plus the settings version in one small
+# shared-memory segment, so every worker process of serve.py answers
+# /api/latest from local memory (no IPC round trip, no database read).
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+
+MAX_SENSORS = int(os.environ.get("AERIUM_SHARED_SENSORS", "64"))
+
+# change counter (bumped after any slot write) | settings version | slots in
+# use | alert counter (bumped when alert events are committed)
+HEADER = struct.Struct("<QQI4xQ")
+# seq | sensor id | ppm (-1 = none) | ts (epoch s, 0 = none) | running
+SLOT = struct.Struct("<Q32sqdB7x")
+SEQ = struct.Struct("<Q")
+VERSION_OFFSET = 8
+COUNT = struct.Struct("<I")
+COUNT_OFFSET = 16
+ALERTS_OFFSET = 24
+
+
+class SharedState:
+    """One seqlock-protected slot per sensor: writers (the acquisition
+    process, workers receiving pushed readings) serialize on `lock`, any
+    number of readers never lock. The settings version is bumped by
+    whichever worker saved the settings, under the same lock.
+
+    Create it before forking; children use the inherited mapping.
+    """
+
+    def __init__(self, lock, max_sensors=MAX_SENSORS):
+        self.max_sensors = max_sensors
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=HEADER.size + SLOT.size * max_sensors
+        )
+        self.buf = self.shm.buf
+        self.lock = lock
+        HEADER.pack_into(self.buf, 0, 0, 0, 0, 0)
+        # slots never move once assigned: cache sensor id -> index per process
+        self._slots = {}
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self, unlink=False):
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+    def seq(self):
+        return SEQ.unpack_from(self.buf, 0)[0]
+
+    def count(self):
+        return COUNT.unpack_from(self.buf, COUNT_OFFSET)[0]
+
+    def _offset(self, index):
+        return HEADER.size + SLOT.size * index
+
+    def _slot_name(self, index):
+        raw = struct.unpack_from("<32s", self.buf, self._offset(index) + 8)[0]
+        return raw.rstrip(b"\0").decode()
+
+    def _find(self, sensor_id):
+        index = self._slots.get(sensor_id)
+        if index is None:
+            for i in range(self.count()):
+                if self._slot_name(i) == sensor_id:
+                    index = self._slots[sensor_id] = i
+                    break
+        return index
+
+    def write_latest(self, sensor_id, latest):
+        """False when every slot is taken by other sensors."""
+        ppm = latest["ppm"]
+        ts = 0.0
+        if latest["timestamp"]:
+            ts = datetime.fromisoformat(latest["timestamp"]).replace(
+                tzinfo=timezone.utc
+            ).timestamp()
+
+        with self.lock:
+            index = self._find(sensor_id)
+            if index is None:
+                index = self.count()
+                if index >= self.max_sensors:
+                    return False
+                struct.pack_into(
+                    "<32s", self.buf, self._offset(index) + 8, sensor_id.encode()
+                )
+                COUNT.pack_into(self.buf, COUNT_OFFSET, index + 1)
+                self._slots[sensor_id] = index
+
+            offset = self._offset(index)
+            seq = SEQ.unpack_from(self.buf, offset)[0]
+            SEQ.pack_into(self.buf, offset, seq + 1)  # odd: write in progress
+            struct.pack_into(
+                "<qdB", self.buf, offset + 40,
+                -1 if ppm is None else ppm, ts, bool(latest["analysis_running"])
+            )
+            SEQ.pack_into(self.buf, offset, seq + 2)
+            SEQ.pack_into(self.buf, 0, self.seq() + 1)
+        return True
+
+    def slot_seq(self, index):
+        return SEQ.unpack_from(self.buf, self._offset(index))[0]
+
+    def read_slot(self, index):
+        offset = self._offset(index)
+        while True:
+            seq, name, ppm, ts, running = SLOT.unpack_from(self.buf, offset)
+            if seq & 1 or SEQ.unpack_from(self.buf, offset)[0] != seq:
+                time.sleep(0)
+                continue
+            break
+
+        return {
+            "sensor_id": name.rstrip(b"\0").decode(),
+            "analysis_running": bool(running),
+            "ppm": None if ppm < 0 else ppm,
+            "timestamp": datetime.fromtimestamp(ts, timezone.utc)
+            .replace(tzinfo=None).isoformat() if ts else None,
+        }
+
+    def read_latest(self, sensor_id):
+        """Latest snapshot of a sensor, None if it never reported."""
+        index = self._find(sensor_id)
+        return None if index is None else self.read_slot(index)
+
+    def settings_version(self):
+        return SEQ.unpack_from(self.buf, VERSION_OFFSET)[0]
+
+    def bump_settings_version(self):
+        with self.lock:
+            version = self.settings_version() + 1
+            SEQ.pack_into(self.buf, VERSION_OFFSET, version)
+        return version
+
+    def alerts(self):
+        return SEQ.unpack_from(self.buf, ALERTS_OFFSET)[0]
+
+    def bump_alerts(self):
+        with self.lock:
+            SEQ.pack_into(self.buf, ALERTS_OFFSET, self.alerts() + 1)
+
+
+class SharedStateFollower:
+    """Worker-side thread turning shared-state changes into local SSE
+    events (the writing process cannot reach other workers' clients).
+    """
+
+    def __init__(self, state, on_latest, on_settings, on_alerts, interval=0.1):
+        # on_latest(sensor_id, latest), on_settings(), on_alerts()
+        self.state = state
+        self.on_latest = on_latest
+        self.on_settings = on_settings
+        self.on_alerts = on_alerts
+        self.interval = interval
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="shared-state-follower", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        seq = self.state.seq()
+        seen = [self.state.slot_seq(i) for i in range(self.state.count())]
+        version = self.state.settings_version()
+        alerts = self.state.alerts()
+
+        while True:
+            time.sleep(self.interval)
+            try:
+                current = self.state.seq()
+                if current != seq:
+                    seq = current
+                    for i in range(self.state.count()):
+                        slot_seq = self.state.slot_seq(i)
+                        if i >= len(seen):
+                            seen.append(0)
+                        if slot_seq != seen[i] and not slot_seq & 1:
+                            seen[i] = slot_seq
+                            latest = self.state.read_slot(i)
+                            self.on_latest(latest["sensor_id"], latest)
+
+                current = self.state.settings_version()
+                if current != version:
+                    version = current
+                    self.on_settings()
+
+                current = self.state.alerts()
+                if current != alerts:
+                    alerts = current
+                    self.on_alerts()
+            except Exception as e:
+                print(f"[shared-state] follower failed: {e}")
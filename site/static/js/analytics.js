@@ -13,6 +13,10 @@ const csvUpload = document.getElementById("csv-upload");
 const csvInput = document.getElementById("csv-file");
 const rangeSelect = document.getElementById("aerium-range");
 
+const sensorQuery = `sensor=${encodeURIComponent(
+  new URLSearchParams(window.location.search).get("sensor") || "default"
+)}`;
+
 const GOOD = 800;
 const BAD = 1200;
 
@@ -48,23 +52,28 @@ function analyze(data) {
   const max = Math.max(...values);
   const bad = values.filter(v => v >= BAD).length;
 
-  avgEl.textContent = avg + " ppm";
-  minEl.textContent = min + " ppm";
-  maxEl.textContent = max + " ppm";
-  badEl.textContent = bad + " min";
-
+  renderStats({ avg, min, max, bad_minutes: bad });
   drawChart(data);
 }
 
+function renderStats(stats) {
+  avgEl.textContent = stats.avg + " ppm";
+  minEl.textContent = stats.min + " ppm";
+  maxEl.textContent = stats.max + " ppm";
+  badEl.textContent = stats.bad_minutes + " min";
+}
+
 /* ===============================
    CHART
 =============================== */
 function drawChart(data) {
-  const labels = data.map(d =>
-    new Date(d.timestamp).toLocaleString()
+  drawSeries(
+    data.map(d => new Date(d.timestamp).toLocaleString()),
+    data.map(d => d.ppm)
   );
-  const values = data.map(d => d.ppm);
+}
 
+function drawSeries(labels, values) {
   if (!analyticsChart) {
     analyticsChart = new Chart(
       document.getElementById("analytics-chart"),
@@ -97,13 +106,39 @@ function drawChart(data) {
 /* ===============================
    AERIUM DATA
 =============================== */
+// the chart cannot show more points than this anyway
+const CHART_POINTS = 800;
+
+// columnar history (?format=columnar): epoch seconds from t0 and the deltas
+function columnTimes(cols) {
+  const ts = new Float64Array(cols.dt.length);
+  let t = cols.t0;
+  cols.dt.forEach((d, i) => {
+    t += d;
+    ts[i] = t;
+  });
+  return ts;
+}
+
 async function loadAerium() {
   const range = rangeSelect.value;
-  const res = await fetch(`/api/history/${range}`);
-  const data = await res.json();
 
-  currentData = data;
-  analyze(data);
+  // stats are aggregated server-side, the chart gets a downsampled series
+  const [statsRes, historyRes] = await Promise.all([
+    fetch(`/api/stats?range=${range}&${sensorQuery}`),
+    fetch(`/api/history/${range}?points=${CHART_POINTS}&format=columnar&${sensorQuery}`)
+  ]);
+  const stats = await statsRes.json();
+  const cols = await historyRes.json();
+
+  currentData = cols;
+  if (!stats.count) return;
+
+  renderStats(stats);
+  drawSeries(
+    Array.from(columnTimes(cols), t => new Date(t * 1000).toLocaleString()),
+    cols.ppm
+  );
 }
 
 rangeSelect.onchange = loadAerium;
@@ -4,8 +4,7 @@
 let chart;
 let lastPPM = null;
 let lastRotation = 0;
-let pollInterval = null;
-let lastQualityPPM = null;
+let eventSource = null;
 
 let goodThreshold = 800;
 let mediumThreshold = 1200;
@@ -18,12 +17,17 @@ let bgFade = 1;
 let currentVisualPPM = null;
 let analysisRunning = true;
 
-let pollingDelay = 1000;
 // let historyOffset = 0;
 // let autoScroll = true;
 // let fullHistory = [];
 
 const MAX_POINTS = 25;
+const chartTs = []; // epoch seconds of the chart points, ascending
+
+// sensor (room) shown by this page: ?sensor=<id>, the built-in one otherwise
+const currentSensor =
+  new URLSearchParams(window.location.search).get("sensor") || "default";
+const sensorQuery = `sensor=${encodeURIComponent(currentSensor)}`;
 
 /* =====================================================
    DOM REFERENCES
@@ -111,40 +115,52 @@ function initNavbar() {
 ===================================================== */
 document.addEventListener("DOMContentLoaded", () => {
   initNavbar();
-  initGlobalState();
+  if (isLivePage) initLivePage();
+  openStream();
 });
 
 /* =====================================================
-   SYSTEM STATE
+   LIVE STREAM (SSE)
 ===================================================== */
-function startSystemStateWatcher() {
-  setInterval(async () => {
-    try {
-      const state = await loadSystemState();
-      updateNavAnalysisState(state.analysis_running);
-    } catch {
-      console.warn("Failed to refresh system state");
-    }
-  }, 2000);
-}
+function openStream() {
+  if (eventSource) return;
 
-function initGlobalState() {
-  refreshSystemState();
-  setInterval(refreshSystemState, 2000);
-}
+  // one connection per tab: the server pushes readings, pause state and
+  // settings changes (it resends the current state on every (re)connect)
+  eventSource = new EventSource(`/api/stream?${sensorQuery}`);
 
-async function refreshSystemState() {
-  try {
-    const state = await loadSystemState();
-    updateNavAnalysisState(state.analysis_running);
+  eventSource.addEventListener("settings", (e) => {
+    applySettings(JSON.parse(e.data));
+  });
 
-    // 🔒 DO NOT touch live polling here
-    // analysisRunning is managed by poll()
-  } catch {
-    console.warn("State sync failed");
-  }
+  eventSource.addEventListener("latest", (e) => {
+    handleLatest(JSON.parse(e.data));
+  });
+
+  // rolling statistics, recomputed server-side in O(1) per reading
+  eventSource.addEventListener("stats", (e) => {
+    lastStats = JSON.parse(e.data);
+    if (isOverviewPage) renderDailyStats(lastStats.today);
+  });
+
+  // threshold crossings are detected once, server-side (alerts.py)
+  eventSource.addEventListener("alert", (e) => {
+    handleAlert(JSON.parse(e.data));
+  });
+
+  // after a reconnect, fetch only the readings missed meanwhile
+  eventSource.onopen = () => {
+    if (isLivePage && chartTs.length) loadRecentPoints(chartTs.at(-1));
+  };
+
+  eventSource.onerror = () => {
+    console.warn("Live stream interrupted, reconnecting");
+  };
 }
 
+/* =====================================================
+   SYSTEM STATE
+===================================================== */
 function updateNavAnalysisState(isRunning) {
   const nav = document.getElementById("nav-analysis");
   const label = document.getElementById("nav-analysis-label");
@@ -161,54 +177,31 @@ function updateNavAnalysisState(isRunning) {
   }
 }
 
-async function loadSystemState() {
-  const res = await fetch("/api/settings");
-  return await res.json();
-}
-
 /* =====================================================
    SETTINGS
 ===================================================== */
-async function loadSharedSettings() {
-  try {
-    const res = await fetch("/api/settings");
-    const s = await res.json();
+function applySettings(s) {
+  updateNavAnalysisState(s.analysis_running);
 
+  if (isLivePage) {
+    applyLiveSettings(s);
+  } else {
     goodThreshold = s.good_threshold;
     badThreshold = s.bad_threshold;
     mediumThreshold = badThreshold;
-  } catch {
-    console.warn("Failed to load shared settings");
   }
-}
 
-/* =====================================================
-   PAGE BOOTSTRAP
-===================================================== */
-(async () => {
-  await loadSharedSettings();
-  const state = await loadSystemState();
-  updateNavAnalysisState(state.analysis_running);
-
-  startSystemStateWatcher();
-
-  if (isLivePage) initLivePage();
-  if (isOverviewPage) {
-    loadOverviewStats();
-    setInterval(loadOverviewStats, 5000);
-  }
-})();
+  if (isOverviewPage) renderOverviewSettings(s);
+}
 
 /* =====================================================
    LIVE PAGE INIT
 ===================================================== */
-async function initLivePage() {
+function initLivePage() {
   analysisRunning = true;
   createChart();
   //   loadInitialHistory();
-  loadLiveSettings();
-  poll();
-  startPolling();
+  loadRecentPoints();
 }
 
 /* =====================================================
@@ -228,27 +221,6 @@ function hidePausedOverlay() {
   pausedOverlay?.classList.remove("active");
 }
 
-/* =====================================================
-   POLLING
-===================================================== */
-function startPolling() {
-  if (!analysisRunning) return;
-  stopPolling();
-  pollInterval = setInterval(poll, pollingDelay);
-}
-
-function stopPolling() {
-  if (pollInterval) {
-    clearInterval(pollInterval);
-    pollInterval = null;
-  }
-}
-
-function updatePollingSpeed(seconds) {
-  pollingDelay = seconds * 1000;
-  startPolling();
-}
-
 /* =====================================================
    HELPERS
 ===================================================== */
@@ -303,18 +275,13 @@ function qualityText(ppm) {
 /* =====================================================
    LIVE SETTINGS
 ===================================================== */
-async function loadLiveSettings() {
-  const res = await fetch("/api/settings");
-  const s = await res.json();
-
+function applyLiveSettings(s) {
   prevGoodThreshold = goodThreshold;
   prevBadThreshold = badThreshold;
 
   goodThreshold = Math.min(s.good_threshold, 2000 - 50);
   badThreshold = Math.min(s.bad_threshold, 2000);
 
-  updatePollingSpeed(s.update_speed || 1);
-
   bgFade = 0;
 
   const start = performance.now();
@@ -389,6 +356,57 @@ Chart.register(zoneBackgroundPlugin);
 //   }));
 //}
 
+// chart points from /api/history/page: the newest page, or the readings
+// after `afterTs` (one index seek, at most MAX_POINTS rows either way)
+async function loadRecentPoints(afterTs = null) {
+  let url = `/api/history/page?${sensorQuery}&limit=${MAX_POINTS}`;
+  if (afterTs !== null) url += `&after_ts=${afterTs}`;
+
+  try {
+    const res = await fetch(url);
+    if (!res.ok) return;
+    const page = await res.json();
+
+    // more missed than the chart holds: the newest page replaces it
+    if (afterTs !== null && page.next) return loadRecentPoints();
+
+    page.readings.forEach((r) => addChartPoint(r.ts, r.ppm));
+    trimChart();
+    chart.update("none");
+  } catch (err) {
+    console.warn("History fetch failed", err);
+  }
+}
+
+// readings carry naive UTC ISO timestamps
+function readingTs(data) {
+  if (!data.timestamp) return Math.floor(Date.now() / 1000);
+  return Math.floor(Date.parse(data.timestamp.slice(0, 19) + "Z") / 1000);
+}
+
+// inserts a point in time order unless the chart already has it (a
+// reading can come from both the stream and a page); false when skipped
+function addChartPoint(ts, ppm) {
+  let i = chartTs.length;
+  while (i > 0 && chartTs[i - 1] > ts) i--;
+  if (i > 0 && chartTs[i - 1] === ts) return false;
+
+  chartTs.splice(i, 0, ts);
+  chart.data.labels.splice(i, 0, new Date(ts * 1000).toLocaleTimeString());
+  chart.data.datasets[0].data.splice(i, 0, ppm);
+  return true;
+}
+
+// drops the oldest points beyond MAX_POINTS; true when some were dropped
+function trimChart() {
+  if (chart.data.labels.length <= MAX_POINTS) return false;
+  const extra = chart.data.labels.length - MAX_POINTS;
+  chartTs.splice(0, extra);
+  chart.data.labels.splice(0, extra);
+  chart.data.datasets[0].data.splice(0, extra);
+  return true;
+}
+
 /* =====================================================
    CHART
 ===================================================== */
@@ -554,35 +572,34 @@ function animateQuality(ppm) {
   qualityEl.style.background = color + "22";
   qualityEl.style.border = `1px solid ${color}55`;
   qualityEl.style.boxShadow = `0 0 12px ${color}33`;
+}
 
-  // ⚠️ flash when crossing bad threshold
-  if (
-    lastQualityPPM !== null &&
-    lastQualityPPM < badThreshold &&
-    ppm >= badThreshold
-  ) {
-    qualityEl.classList.add("blink-warning");
-    setTimeout(() => qualityEl.classList.remove("blink-warning"), 900);
-  }
+/* =====================================================
+   ALERTS
+===================================================== */
+const ALERT_LEVELS = ["good", "medium", "bad", "alert"];
+
+function handleAlert(event) {
+  // ⚠️ flash only when the air gets worse
+  if (ALERT_LEVELS.indexOf(event.level) <= ALERT_LEVELS.indexOf(event.previous)) return;
+  if (ALERT_LEVELS.indexOf(event.level) < ALERT_LEVELS.indexOf("bad")) return;
 
-  lastQualityPPM = ppm;
+  for (const el of [qualityEl, document.getElementById("air-sub")]) {
+    if (!el) continue;
+    el.classList.add("blink-warning");
+    setTimeout(() => el.classList.remove("blink-warning"), 900);
+  }
 }
 
 /* =====================================================
-   POLL
+   LATEST READING
 ===================================================== */
-async function poll() {
-  const res = await fetch("/api/latest", {
-    cache: "no-store",
-  });
-  const data = await res.json();
-
+function handleLatest(data) {
   /* ⏸ PAUSE HANDLING */
   if (data.analysis_running === false) {
     analysisRunning = false;
 
     updateNavAnalysisState(false);
-    stopPolling(); // 🔥 stop polling loop
 
     if (isLivePage) {
       showPausedOverlay();
@@ -595,17 +612,15 @@ async function poll() {
   if (!analysisRunning && data.analysis_running === true) {
     analysisRunning = true;
     updateNavAnalysisState(true);
-    startPolling(); // 🔥 resume polling
   }
 
-  if (!analysisRunning) return;
-
   if (isLivePage) hidePausedOverlay();
 
   if (!data || data.ppm == null) return;
 
   const ppm = data.ppm;
-  console.log("New PPM", ppm);
+
+  if (isOverviewPage) updateOverviewLive(ppm);
 
   /* LIVE PAGE UPDATES */
   if (isLivePage) {
@@ -613,23 +628,13 @@ async function poll() {
     animateValue(ppm);
     animateQuality(ppm);
 
-    const timeLabel = new Date(
-      data.timestamp ?? Date.now()
-    ).toLocaleTimeString();
-
-    // 1️⃣ add new point
-    chart.data.labels.push(timeLabel);
-    chart.data.datasets[0].data.push(ppm);
+    // 1️⃣ add new point (the stream resends the current one on reconnect)
+    if (!addChartPoint(readingTs(data), ppm)) return;
 
     // 🔥 no layout animation, dataset animation still runs
     chart.update({ duration: 0 });
 
-    if (chart.data.labels.length > MAX_POINTS) {
-      chart.data.labels.shift();
-      chart.data.datasets[0].data.shift();
-
-      chart.update("none");
-    }
+    if (trimChart()) chart.update("none");
   }
 }
 
@@ -650,6 +655,7 @@ exportBtn?.addEventListener("click", () => {
 });
 
 resetBtn?.addEventListener("click", () => {
+  chartTs.length = 0;
   chart.data.labels = [];
   chart.data.datasets[0].data = [];
   chart.update();
@@ -681,7 +687,10 @@ function updateAirHealth(avgPPM) {
 /* =====================================================
    OVERVIEW STATS
 ===================================================== */
-async function loadOverviewStats() {
+// latest "stats" event: {"5m": {...}, "1h": {...}, "today": {...}}
+let lastStats = null;
+
+function renderOverviewSettings(settings) {
   const avgEl = document.getElementById("avg-ppm");
   const maxEl = document.getElementById("max-ppm");
   const badEl = document.getElementById("bad-time");
@@ -694,75 +703,58 @@ async function loadOverviewStats() {
 
   if (!airCard || !statusEl) return;
 
-  try {
-    const settings = await loadSystemState();
-    updateNavAnalysisState(settings.analysis_running);
-
-    /* ⏸ ANALYSIS PAUSED */
-    if (!settings.analysis_running) {
-      airCard.classList.remove("good", "medium", "bad");
-      airCard.classList.add("paused");
-
-      statusEl.textContent = "Analyse en pause";
-      subEl.textContent = "Aucune donnée en cours";
-
-      if (analysisEl) {
-        analysisEl.textContent = "Pause";
-        analysisWidget?.classList.remove("good");
-        analysisWidget?.classList.add("paused");
-      }
+  thresholdsEl.textContent = `${settings.good_threshold} / ${settings.bad_threshold} ppm`;
 
-      if (avgEl) avgEl.textContent = "—";
-      if (maxEl) maxEl.textContent = "—";
-      if (badEl) badEl.textContent = "—";
-
-      thresholdsEl.textContent = `${settings.good_threshold} / ${settings.bad_threshold} ppm`;
-
-      updateCO2Thermo?.(0);
-      return;
-    }
+  /* ⏸ ANALYSIS PAUSED */
+  if (!settings.analysis_running) {
+    airCard.classList.remove("good", "medium", "bad");
+    airCard.classList.add("paused");
 
-    /* ▶️ ANALYSIS RUNNING */
-    airCard.classList.remove("paused");
-    analysisWidget?.classList.remove("paused");
-    analysisWidget?.classList.add("good");
+    statusEl.textContent = "Analyse en pause";
+    subEl.textContent = "Aucune donnée en cours";
 
     if (analysisEl) {
-      analysisEl.textContent = "Active";
+      analysisEl.textContent = "Pause";
+      analysisWidget?.classList.remove("good");
+      analysisWidget?.classList.add("paused");
     }
 
-    thresholdsEl.textContent = `${settings.good_threshold} / ${settings.bad_threshold} ppm`;
+    if (avgEl) avgEl.textContent = "—";
+    if (maxEl) maxEl.textContent = "—";
+    if (badEl) badEl.textContent = "—";
 
-    /* LIVE SNAPSHOT */
-    const liveRes = await fetch("/api/latest");
-    const live = await liveRes.json();
+    updateCO2Thermo?.(0);
+    return;
+  }
 
-    if (live?.ppm != null) {
-      updateAirHealth(live.ppm);
-      updateCO2Thermo(live.ppm);
-      animateSubValue(live.ppm, subEl);
-    }
+  /* ▶️ ANALYSIS RUNNING */
+  airCard.classList.remove("paused");
+  analysisWidget?.classList.remove("paused");
+  analysisWidget?.classList.add("good");
 
-    /* TODAY HISTORY */
-    const res = await fetch("/api/history/today");
-    const data = await res.json();
-    if (!data.length) return;
-
-    const values = data.map((d) => d.ppm);
-    const avg = Math.round(values.reduce((a, b) => a + b, 0) / values.length);
-    const max = Math.max(...values);
-    const badMinutes = values.filter((v) => v >= badThreshold).length;
-
-    if (avgEl) avgEl.textContent = `${avg} ppm`;
-    if (maxEl) maxEl.textContent = `${max} ppm`;
-    if (badEl) badEl.textContent = `${badMinutes} min`;
-  } catch (e) {
-    console.error("Overview stats failed", e);
+  if (analysisEl) {
+    analysisEl.textContent = "Active";
   }
+
+  if (lastStats) renderDailyStats(lastStats.today);
 }
 
-if (isOverviewPage) {
-  loadOverviewStats();
+function updateOverviewLive(ppm) {
+  updateAirHealth(ppm);
+  updateCO2Thermo(ppm);
+  animateSubValue(ppm, document.getElementById("air-sub"));
+}
+
+function renderDailyStats(stats) {
+  const avgEl = document.getElementById("avg-ppm");
+  const maxEl = document.getElementById("max-ppm");
+  const badEl = document.getElementById("bad-time");
+
+  if (!stats || !stats.count || !analysisRunning) return;
+
+  if (avgEl) avgEl.textContent = `${stats.avg} ppm`;
+  if (maxEl) maxEl.textContent = `${stats.max} ppm`;
+  if (badEl) badEl.textContent = `${stats.bad_minutes} min`;
 }
 
 /* =====================================================
@@ -797,11 +789,6 @@ function animateSubValue(ppm, el) {
   requestAnimationFrame(animate);
   el.style.color = ppmColor(ppm);
 
-  if (lastSubPPM < badThreshold && ppm >= badThreshold) {
-    el.classList.add("blink-warning");
-    setTimeout(() => el.classList.remove("blink-warning"), 900);
-  }
-
   lastSubPPM = ppm;
 }
 
@@ -810,29 +797,40 @@ function animateSubValue(ppm, el) {
 ===================================================== */
 document
   .getElementById("export-day-csv")
-  ?.addEventListener("click", async () => {
-    const res = await fetch("/api/history/today");
-    const data = await res.json();
-
-    let csv = "time,ppm\n";
-    data.forEach((d) => {
-      const time = new Date(d.timestamp).toLocaleTimeString();
-      csv += `${time},${d.ppm}\n`;
-    });
-
-    const blob = new Blob([csv], { type: "text/csv" });
+  ?.addEventListener("click", () => {
+    // streamed by the server straight to the download, nothing kept here
     const a = document.createElement("a");
-    a.href = URL.createObjectURL(blob);
+    a.href = `/api/export?range=today&format=csv&${sensorQuery}`;
     a.download = "rapport_journalier.csv";
     a.click();
   });
 
 /* =====================================================
-   EXPORT DAILY PDF (PLACEHOLDER)
+   EXPORT DAILY PDF
 ===================================================== */
-document.getElementById("export-day-pdf")?.addEventListener("click", () => {
-  window.open("/api/report/daily/pdf", "_blank");
-});
+document
+  .getElementById("export-day-pdf")
+  ?.addEventListener("click", async () => {
+    // open the tab now (popup blockers), point it at the PDF once rendered
+    const win = window.open("", "_blank");
+
+    try {
+      let res = await fetch(`/api/report/daily?${sensorQuery}`, { method: "POST" });
+      let job = await res.json();
+
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise((r) => setTimeout(r, 500));
+        res = await fetch(`/api/report/jobs/${job.job_id}`);
+        job = await res.json();
+      }
+
+      if (job.status !== "done") throw new Error(job.error || "report failed");
+      win.location = job.download;
+    } catch (e) {
+      win?.close();
+      console.error("PDF export failed", e);
+    }
+  });
 
 /* =====================================================
    CO2 THERMOMETER
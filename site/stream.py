@@ -0,0 +1,73 @@
+# stream.py
+# In-process fan-out for Server-Sent Events: publishers call
+# broker.publish(), each /api/stream client drains its own bounded queue.
+import json
+import queue
+import threading
+
+KEEPALIVE_S = 15
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Broker:
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._subscribers = {}  # queue -> topics (None = everything)
+        self._lock = threading.Lock()
+        self._dropped = 0
+
+    def subscribe(self, topics=None):
+        q = queue.Queue(self.queue_size)
+        with self._lock:
+            self._subscribers[q] = set(topics) if topics is not None else None
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.pop(q, None)
+
+    def publish(self, event, data, topic=None):
+        # serialized once, whatever the number of subscribers; a topic
+        # (sensor id) only reaches clients following it
+        message = format_event(event, data)
+
+        with self._lock:
+            subscribers = [
+                q for q, topics in self._subscribers.items()
+                if topic is None or topics is None or topic in topics
+            ]
+
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # slow client: drop its oldest message rather than block
+                try:
+                    q.get_nowait()
+                    q.put_nowait(message)
+                except (queue.Empty, queue.Full):
+                    pass
+                self._dropped += 1
+
+    def stream(self, initial=(), topics=None):
+        q = self.subscribe(topics)
+        try:
+            for message in initial:
+                yield message
+            while True:
+                try:
+                    yield q.get(timeout=KEEPALIVE_S)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(q)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "dropped": self._dropped}
+
+
+broker = Broker()
@@ -0,0 +1,115 @@
+# test_alerts.py
+# Alert thresholds: bad settings are refused, and an alert evaluation
+# failure never costs the readings of a batch.
+# Run from site/: python -m unittest test_alerts
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import alerts
+import config
+import database
+from database import ConnectionPool
+from ingest import WriteBehindBuffer
+
+
+class AlertTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.tmp.name, "test.sqlite"), size=2, timeout=0.5)
+        self._saved, database._pool = database._pool, self.pool
+        database.init_db()
+        config.invalidate_settings()
+
+    def tearDown(self):
+        database._pool = self._saved
+        config.invalidate_settings()
+        self.pool.close_all()
+        self.tmp.cleanup()
+
+    def count_readings(self):
+        with database.get_db() as db:
+            return db.execute("SELECT COUNT(*) FROM co2_readings").fetchone()[0]
+
+
+class IsolatedHookTest(AlertTestCase):
+    def test_failing_alert_hook_keeps_readings(self):
+        settings = dict(config.DEFAULT_SETTINGS, alert_threshold=None)
+        engine = alerts.AlertEngine(lambda: settings, debounce=0)
+        writer = WriteBehindBuffer()
+        writer.add_hook(engine.apply, isolated=True)
+
+        rows = [("s1", 1760000000 + i, 1500) for i in range(3)]
+        self.assertEqual(writer.write(rows), 3)
+        self.assertEqual(self.count_readings(), 3)
+        self.assertEqual(writer.stats()["hook_errors"], 1)
+        self.assertEqual(writer.stats()["errors"], 0)
+
+    def test_failing_hook_fails_batch_unless_isolated(self):
+        def broken(db, rows):
+            raise TypeError("boom")
+
+        writer = WriteBehindBuffer()
+        writer.add_hook(broken)
+        with self.assertRaises(TypeError):
+            writer.write([("s1", 1760000000, 600)])
+        self.assertEqual(self.count_readings(), 0)
+
+
+class ThresholdOrderTest(unittest.TestCase):
+    def level(self, ppm, **settings):
+        engine = alerts.AlertEngine(lambda: dict(config.DEFAULT_SETTINGS, **settings))
+        return alerts.LEVELS[alerts.classify(ppm, engine.thresholds())]
+
+    def test_default_thresholds(self):
+        self.assertEqual(
+            [self.level(ppm) for ppm in (600, 900, 1300, 1500)],
+            ["good", "medium", "bad", "alert"],
+        )
+
+    def test_alert_threshold_below_bad_is_raised(self):
+        # bad moved above the default alert threshold (1400) from the settings page
+        self.assertEqual(self.level(1450, bad_threshold=1600), "medium")
+        self.assertEqual(self.level(1599, bad_threshold=1600), "medium")
+        self.assertEqual(self.level(1700, bad_threshold=1600), "alert")
+        self.assertEqual(self.level(1700, bad_threshold=1600, alert_threshold=1800), "bad")
+
+
+class SettingsValidationTest(AlertTestCase):
+    def setUp(self):
+        super().setUp()
+        import app
+        self.client = app.create_app(start=False, acquire=False).test_client()
+        # a threshold change rebuilds the rollups in a thread that would
+        # outlive the test database
+        patcher = mock.patch("rollups.rebuild_async")
+        self.rebuild_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, data):
+        return self.client.post("/api/settings", json=data)
+
+    def test_rejects_invalid_thresholds(self):
+        for data in (
+            {"alert_threshold": None},
+            {"good_threshold": "800"},
+            {"bad_threshold": True},
+            {"bad_threshold": -5},
+            {"good_threshold": 1300},
+            {"good_threshold": 900, "bad_threshold": 900},
+        ):
+            resp = self.post(data)
+            self.assertEqual(resp.status_code, 400, data)
+            self.assertIn("error", resp.get_json())
+        self.assertEqual(config.load_settings(), config.DEFAULT_SETTINGS)
+
+    def test_accepts_ordered_thresholds(self):
+        self.assertEqual(self.post({"good_threshold": 700, "bad_threshold": 1600}).status_code, 200)
+        settings = config.load_settings()
+        self.assertEqual((settings["good_threshold"], settings["bad_threshold"]), (700, 1600))
+        self.rebuild_async.assert_called_once_with((700, 1600, 1600))
+
+
+if __name__ == "__main__":
+    unittest.main()
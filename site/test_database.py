@@ -0,0 +1,52 @@
+# test_database.py
+# Connection pool: a failing statement must not cost a pool slot.
+# Run from site/: python -m unittest test_database
+import os
+import tempfile
+import unittest
+
+import database
+from database import ConnectionPool
+
+
+class PoolReleaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.tmp.name, "test.sqlite"), size=2, timeout=0.5)
+        self._saved, database._pool = database._pool, self.pool
+        database.init_db()
+
+    def tearDown(self):
+        database._pool = self._saved
+        self.pool.close_all()
+        self.tmp.cleanup()
+
+    def test_failing_statements_do_not_exhaust_pool(self):
+        import history
+
+        # more failures than the pool has connections
+        for _ in range(self.pool.size * 4):
+            with self.assertRaises(OverflowError):
+                history.fetch_readings(0, 10**20)
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+
+        # still usable afterwards
+        self.assertEqual(history.fetch_readings(0, 10), [])
+
+    def test_with_block_commits_or_rolls_back(self):
+        with database.get_db() as db:
+            db.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+
+        with self.assertRaises(RuntimeError):
+            with database.get_db() as db:
+                db.execute("INSERT INTO settings (key, value) VALUES ('b', '2')")
+                raise RuntimeError("boom")
+
+        with database.get_db() as db:
+            keys = [r[0] for r in db.execute("SELECT key FROM settings ORDER BY key")]
+        self.assertEqual(keys, ["a"])
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# test_rollups.py
+# Rollups kept by the ingest hook match a rebuild, and long-range stats
+# from them match the ones computed from every reading.
+# Run from site/: python -m unittest test_rollups
+import os
+import random
+import tempfile
+import unittest
+
+import config
+import database
+import rollups
+from analysis import range_stats, rollup_stats
+from database import ConnectionPool
+from ingest import WriteBehindBuffer
+
+LEVEL_NAMES = [name for name, _, _ in rollups.LEVELS]
+
+
+class RollupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.tmp.name, "test.sqlite"), size=2, timeout=0.5)
+        self._saved, database._pool = database._pool, self.pool
+        database.init_db()
+        config.invalidate_settings()
+        rollups.ensure_built()
+
+        # readings with jitter, short and long gaps (past MAX_GAP_S)
+        rng = random.Random(1)
+        self.rows, ts = [], 1760000000
+        while len(self.rows) < 5000:
+            ts += rng.choice([1, 1, 2, 5, 59, 299, 300, 301, 4000])
+            self.rows.append(("s1", ts, rng.randint(400, 2000)))
+
+        # mostly in order, the second half of the batches late and shuffled
+        batches = [self.rows[i:i + rng.randint(1, 300)] for i in range(0, len(self.rows), 150)]
+        tail = batches[len(batches) // 2:]
+        rng.shuffle(tail)
+        writer = WriteBehindBuffer()
+        writer.add_hook(rollups.apply)
+        for batch in batches[:len(batches) // 2] + tail:
+            writer.write(batch)
+
+    def tearDown(self):
+        database._pool = self._saved
+        config.invalidate_settings()
+        self.pool.close_all()
+        self.tmp.cleanup()
+
+    def snapshot(self):
+        with database.get_db() as db:
+            return {
+                level: db.execute(f"SELECT * FROM co2_rollup_{level} ORDER BY sensor_id, bucket").fetchall()
+                for level in LEVEL_NAMES
+            }
+
+    def test_ingest_hook_matches_rebuild(self):
+        incremental = self.snapshot()
+        self.assertTrue(rollups.rebuild(pause=0))
+        rebuilt = self.snapshot()
+        for level in LEVEL_NAMES:
+            self.assertEqual([tuple(r) for r in incremental[level]], [tuple(r) for r in rebuilt[level]])
+
+    def test_rollup_stats_match_raw(self):
+        settings = config.load_settings()
+        lo, hi = self.rows[0][1], self.rows[-1][1]
+        rng = random.Random(2)
+        for _ in range(50):
+            start = rng.randint(lo - 600, hi)
+            end = rng.randint(start + 1, hi + 600)
+            raw = range_stats(start, end, settings, "s1")
+            fast = rollup_stats(start, end, settings, "s1")
+            del raw["percentiles"], fast["percentiles"]
+            self.assertEqual(raw, fast, (start, end))
+
+    def test_other_thresholds_need_a_rebuild(self):
+        settings = dict(config.load_settings(), bad_threshold=1500)
+        lo, hi = self.rows[0][1], self.rows[-1][1]
+        self.assertIsNone(rollup_stats(lo, hi, settings, "s1"))
+
+        self.assertTrue(rollups.rebuild(config.thresholds(settings), pause=0))
+        raw = range_stats(lo, hi, settings, "s1")
+        fast = rollup_stats(lo, hi, settings, "s1")
+        self.assertEqual(raw["exposure_s"], fast["exposure_s"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,6 +10,7 @@ from kivy.uix.popup import Popup
 from kivy.clock import Clock
 from kivy.graphics import Color, Rectangle, Line
 from kivy.properties import NumericProperty, StringProperty, BooleanProperty
+from collections import deque
 from datetime import datetime, timedelta
 import random
 import math
@@ -76,19 +77,21 @@ class SleepMonitor:
     """Simule la détection du sommeil via les capteurs"""
     def __init__(self):
         self.is_sleeping = False
-        self.movement_data = []
+        # fenêtre glissante des 20 dernières mesures et sa somme courante
+        self.movement_data = deque(maxlen=20)
+        self.movement_sum = 0.0
         self.sensitivity = 0.5
     
     def process_sensor_data(self):
         """Simule l'analyse des données des capteurs (accéléromètre, etc.)"""
         # En production, ceci analyserait les vraies données des capteurs
         movement = random.random()
+        if len(self.movement_data) == self.movement_data.maxlen:
+            self.movement_sum -= self.movement_data[0]
         self.movement_data.append(movement)
+        self.movement_sum += movement
         
-        if len(self.movement_data) > 20:
-            self.movement_data.pop(0)
-        
-        avg_movement = sum(self.movement_data) / len(self.movement_data)
+        avg_movement = self.movement_sum / len(self.movement_data)
         self.is_sleeping = avg_movement < self.sensitivity
         
         return self.is_sleeping
@@ -97,7 +100,7 @@ class SleepMonitor:
         """Retourne un score de qualité de sommeil"""
         if not self.movement_data:
             return 0
-        avg = sum(self.movement_data) / len(self.movement_data)
+        avg = self.movement_sum / len(self.movement_data)
         return max(0, min(100, int((1 - avg) * 100)))
 
 